@@ -0,0 +1,452 @@
+"""
+Persistent store of per-day aggregates of the dataset for incremental reporting.
+For every account x user x partition x start day x end day of tasks, the store holds
+    * the number of tasks
+    * the number of tasks by termination reason (completed, cancelled, failed, timeout)
+    * mergeable quantile sketches (see quantile_sketch.py) of AllocCPUS, ElapsedRaw and CPUTimeRaw
+Both days are part of the key, since the report counts tasks by the day they started and by
+the day they ended. The store remembers how many bytes of the dataset it has already read,
+so update() only parses rows which were appended since the last update. It assumes that
+every task is appended to the dataset only once.
+The store is a directory with one partition (json file) per account and month of the start day
+of the records, and an index (meta.json) with the offset and the first/last day of every partition:
+    <store>/meta.json
+    <store>/<account>/<yyyy-mm>.json
+Only the partitions touching the requested period are read, and only changed partitions are
+written, so the cost of a run depends on the period and the new rows, not on the history.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: path to csv file (dump of the database)
+OUT: stats_dict for any account and period (AggregateStatsExtractor)
+"""
+
+import io
+import json
+import os
+import shutil
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+from data_cleaner import data_cleaner
+from data_loader import read_dataset_chunks
+from quantile_sketch import QuantileSketch, DEFAULT_RELATIVE_ACCURACY
+from stats_extractor import StatsExtractor
+
+METRICS = ["AllocCPUS", "ElapsedRaw", "CPUTimeRaw"]
+STATES = ["COMPLETED", "CANCELLED", "FAILED", "TIMEOUT"]
+KEY_COLS = ["Account", "User", "Partition", "StartDate", "EndDate"]
+
+
+def _to_day(date) -> str:
+    """
+    Format a day as 'yyyy-mm-dd' (None for NaT).
+    """
+    return None if pd.isna(date) else pd.Timestamp(date).strftime("%Y-%m-%d")
+
+
+class _BoundedReader(io.RawIOBase):
+    """
+    Reads at most n_bytes from a binary file, e.g. to parse only the complete lines of a growing file.
+    """
+
+
+    def __init__(self, file, n_bytes: int):
+        self.file = file
+        self.remaining = n_bytes
+
+
+    def readable(self) -> bool:
+        return True
+
+
+    def readinto(self, buffer) -> int:
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def _complete_lines_end(file, start: int, end: int, block_size: int=65536) -> int:
+    """
+    Returns the position after the last line break between start and end of a binary file
+    (start if there is none), reading backwards in blocks.
+    """
+    position = end
+    while position > start:
+        block_start = max(start, position - block_size)
+        file.seek(block_start)
+        i = file.read(position - block_start).rfind(b"\n")
+        if i >= 0:
+            return block_start + i + 1
+        position = block_start
+    return start
+
+
+def _partition_month(key: tuple) -> str:
+    """
+    Month ('yyyy-mm') of the partition of a record: the month of its start day, or of its end day
+    if it did not start (None if it has neither).
+    """
+    day = key[2] or key[3]
+    return day[:7] if day is not None else None
+
+
+class AggregateStore:
+
+
+    def __init__(self, path: str=None, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY):
+        self.path = path
+        self.relative_accuracy = relative_accuracy
+        self.offset = 0 # number of bytes of the dataset already aggregated
+        self.header = None # header line of the dataset
+        self.partitions = {} # account -> {month -> [first day, last day] of the records in the partition}
+        self.records = {} # account -> {(user, partition, start day, end day) -> record}; loaded partitions only
+        self.by_day = {} # account -> {day -> set of keys which start or end on that day}; loaded partitions only
+        self._loaded = set() # (account, month) of the partitions in memory
+        self._modified = set() # (account, month) of the partitions changed since the last save
+        self._saved_offset = 0 # offset of the store on disk
+        self._cleared = False # the store on disk belongs to a replaced dataset
+
+
+    @classmethod
+    def open(cls, path: str, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY) -> "AggregateStore":
+        """
+        Opens the store saved in the directory path or creates an empty store if there is none.
+        Only the index of the partitions is read; the records of a partition are read
+        when a period touching it is requested.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        path: str; path to the directory of the store
+        relative_accuracy: float; accuracy of the sketches of a new store
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        AggregateStore
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if os.path.isfile(path):
+            raise ValueError(f"{path} is a store of an older version, please delete it to rebuild the store.")
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            return cls(path, relative_accuracy)
+
+        with open(os.path.join(path, "meta.json"), "r") as file:
+            meta = json.load(file)
+
+        store = cls(path, meta["relative_accuracy"])
+        store.offset = store._saved_offset = meta["offset"]
+        store.header = meta["header"]
+        store.partitions = meta["partitions"]
+        return store
+
+
+    def _partition_path(self, account: str, month: str, path: str=None) -> str:
+        return os.path.join(path or self.path, urllib.parse.quote(account, safe=""), month + ".json")
+
+
+    def _load_partition(self, account: str, month: str):
+        """
+        Reads the records of a partition into memory (once).
+        """
+        if (account, month) in self._loaded:
+            return
+        self._loaded.add((account, month))
+        if self.path is None or self._cleared or month not in self.partitions.get(account, {}):
+            return
+
+        with open(self._partition_path(account, month), "r") as file:
+            records = json.load(file)
+        for user, partition, start_day, end_day, n_tasks, states, sketches in records:
+            record = {"n_tasks": n_tasks, "states": states,
+                      "sketches": {metric: QuantileSketch.from_dict(sketches[metric]) for metric in METRICS}}
+            self._add_record(account, (user, partition, start_day, end_day), record)
+
+
+    def save(self, path: str=None):
+        """
+        Saves the store to the directory path (or the directory the store was opened from):
+        the partitions changed since the last save and the index (meta.json). Nothing is written
+        if no rows were added.
+        """
+        path = path or self.path
+        if path != self.path:
+            # A copy needs all partitions
+            for account, months in self.partitions.items():
+                for month in months:
+                    self._load_partition(account, month)
+            self._modified = {(account, month) for account, months in self.partitions.items() for month in months}
+        elif not self._modified and self.offset == self._saved_offset and not self._cleared:
+            return
+
+        if self._cleared and os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path, exist_ok=True)
+
+        # Write to temporary files first, so an interrupted save does not corrupt the store;
+        # the index is replaced last, since its offset marks the rows contained in the partitions
+        partition_paths = []
+        for account, month in self._modified:
+            records = [[*key, record["n_tasks"], record["states"],
+                        {metric: sketch.to_dict() for metric, sketch in record["sketches"].items()}]
+                       for key, record in self.records[account].items() if _partition_month(key) == month]
+            partition_path = self._partition_path(account, month, path)
+            os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+            with open(partition_path + ".tmp", "w") as file:
+                json.dump(records, file)
+            partition_paths.append(partition_path)
+        meta = {"relative_accuracy": self.relative_accuracy, "offset": self.offset, "header": self.header,
+                "partitions": self.partitions}
+        with open(os.path.join(path, "meta.json.tmp"), "w") as file:
+            json.dump(meta, file)
+
+        for partition_path in partition_paths:
+            os.replace(partition_path + ".tmp", partition_path)
+        os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+
+        self.path = path
+        self._modified = set()
+        self._saved_offset = self.offset
+        self._cleared = False
+
+
+    def update(self, dataset_path: str, chunksize: int=500_000) -> int:
+        """
+        Aggregates all complete lines which were appended to the dataset since the last update.
+        The new lines are parsed in chunks of chunksize rows. If the dataset is smaller than
+        at the last update (i.e. it was replaced), the store is reset.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        dataset_path: str; path to pipe-separated csv file
+        chunksize: int; number of rows aggregated at once
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        int; number of new rows
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        size = os.path.getsize(dataset_path)
+        if size < self.offset:
+            self.__init__(self.path, self.relative_accuracy)
+            self._cleared = True
+
+        with open(dataset_path, "rb") as file:
+            if self.offset == 0:
+                header_line = file.readline()
+                self.header = header_line.decode().rstrip("\r\n")
+                self.offset = len(header_line)
+
+            # Only consume complete lines; a partially written last line is read at the next update
+            end = _complete_lines_end(file, self.offset, size)
+            if end == self.offset:
+                return 0
+
+            file.seek(self.offset)
+            reader = io.BufferedReader(_BoundedReader(file, end - self.offset))
+            n_rows = self._add_chunks(read_dataset_chunks(reader, chunksize=chunksize, header=self.header.split("|")))
+
+        self.offset = end
+        return n_rows
+
+
+    def update_from_text(self, data: bytes, chunksize: int=500_000) -> int:
+        """
+        Aggregates lines of the dataset (without header line), e.g. read from a file or a stream.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        data: bytes; complete lines in the format of the dataset
+        chunksize: int; number of rows aggregated at once
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        int; number of new rows
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        return self._add_chunks(read_dataset_chunks(io.BytesIO(data), chunksize=chunksize, header=self.header.split("|")))
+
+
+    def _add_chunks(self, chunks) -> int:
+        n_rows = 0
+        for chunk in chunks:
+            n_rows += len(chunk)
+            self.add_cleaned_dataset(data_cleaner(chunk))
+        return n_rows
+
+
+    def add_cleaned_dataset(self, cleaned_dataset: pd.DataFrame):
+        """
+        Adds the aggregates of a cleaned dataset (data_cleaner without account or period filter).
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        cleaned_dataset: pd.DataFrame
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if len(cleaned_dataset) == 0:
+            return
+
+        # Code every task by its key, then sort tasks by key once
+        groups = cleaned_dataset.groupby(KEY_COLS, dropna=False, sort=False, observed=True)
+        key_codes = groups.ngroup().to_numpy()
+        n_keys = groups.ngroups
+        order = np.argsort(key_codes, kind="stable")
+        counts = np.bincount(key_codes, minlength=n_keys)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        state_codes = pd.Index(STATES).get_indexer(cleaned_dataset["State"])
+        valid = state_codes >= 0
+        state_counts = np.bincount(key_codes[valid] * len(STATES) + state_codes[valid],
+                                   minlength=n_keys * len(STATES)).reshape(n_keys, len(STATES))
+
+        keys = cleaned_dataset[KEY_COLS].iloc[order[offsets[:-1]]]
+        metric_values = {metric: cleaned_dataset[metric].to_numpy()[order] for metric in METRICS}
+
+        for i, (account, user, partition, start_date, end_date) in enumerate(keys.itertuples(index=False)):
+            # Job steps have no user/partition; None (unlike NaN) can be compared and stored as json
+            key = (None if pd.isna(user) else user, None if pd.isna(partition) else partition,
+                   _to_day(start_date), _to_day(end_date))
+            month = _partition_month(key)
+            if month is None: # tasks which neither started nor ended are never part of a period
+                continue
+            sketches = {metric: QuantileSketch(self.relative_accuracy).update(metric_values[metric][offsets[i]:offsets[i+1]])
+                        for metric in METRICS}
+            record = {"n_tasks": int(counts[i]), "states": state_counts[i].tolist(), "sketches": sketches}
+
+            # Merge into the stored partition, which has to be read first
+            self._load_partition(account, month)
+            self._add_record(account, key, record)
+            days = [day for day in key[2:] if day is not None]
+            bounds = self.partitions.setdefault(account, {}).setdefault(month, [min(days), max(days)])
+            bounds[0], bounds[1] = min(bounds[0], *days), max(bounds[1], *days)
+            self._modified.add((account, month))
+
+
+    def _add_record(self, account: str, key: tuple, record: dict):
+        """
+        Merges a record into the store and indexes it by its start and end day.
+        """
+        account_records = self.records.setdefault(account, {})
+        if key in account_records:
+            stored = account_records[key]
+            stored["n_tasks"] += record["n_tasks"]
+            stored["states"] = [a + b for a, b in zip(stored["states"], record["states"])]
+            for metric in METRICS:
+                stored["sketches"][metric].merge(record["sketches"][metric])
+        else:
+            account_records[key] = record
+            account_days = self.by_day.setdefault(account, {})
+            for day in key[2:]:
+                if day is not None:
+                    account_days.setdefault(day, set()).add(key)
+
+
+    def get_records(self, account: str, period_start_date: str, period_end_date: str) -> list:
+        """
+        Returns the (key, record) pairs of an account of tasks which start or/and end in period.
+        Only the partitions with days in the period are read, and only the days of the period are looked up.
+        """
+        for month, (first_day, last_day) in self.partitions.get(account, {}).items():
+            if first_day <= period_end_date and last_day >= period_start_date:
+                self._load_partition(account, month)
+
+        account_days = self.by_day.get(account, {})
+        keys = set()
+        for day in pd.date_range(period_start_date, period_end_date, freq="D").strftime("%Y-%m-%d"):
+            keys |= account_days.get(day, set())
+        account_records = self.records[account] if keys else {}
+        return [(key, account_records[key]) for key in sorted(keys, key=str)]
+
+
+class AggregateStatsExtractor(StatsExtractor):
+    """
+    Builds the stats_dict of StatsExtractor for an account and period from an AggregateStore.
+    Basic stats and termination stats are exact, quantiles of the task metrics are estimated
+    by the merged sketches (min, max and mean are exact).
+    """
+
+
+    def __init__(self, store: AggregateStore, account: str, period_start_date: str, period_end_date: str):
+        records = store.get_records(account, period_start_date, period_end_date)
+        if not records:
+            raise ValueError("No tasks for this account were recorded in the given time frame.")
+
+        self.account = account
+        self.use_sketches = True
+        self.relative_accuracy = store.relative_accuracy
+
+        self.keys = pd.DataFrame([key for key, record in records], columns=["User", "Partition", "StartDate", "EndDate"])
+        self.n_tasks = np.array([record["n_tasks"] for key, record in records])
+        self.states = np.array([record["states"] for key, record in records]).reshape(-1, len(STATES))
+        self.sketches = [record["sketches"] for key, record in records]
+
+        # Days are 'yyyy-mm-dd' strings, so they can be compared as strings (None: task did not end)
+        self.started = (self.keys["StartDate"].fillna("") >= period_start_date).to_numpy()
+        self.ended = (self.keys["EndDate"].fillna("~") <= period_end_date).to_numpy()
+        self.started_and_ended = self.started & self.ended
+
+        user_counts = pd.Series(self.n_tasks).groupby(self.keys["User"].to_numpy(), sort=False).sum().sort_values(ascending=False, kind="stable")
+        partition_counts = pd.Series(self.n_tasks).groupby(self.keys["Partition"].to_numpy(), sort=False).sum().sort_values(ascending=False, kind="stable")
+        self.users, self.user_counts = user_counts.index.tolist(), user_counts.values.tolist()
+        self.partitions, self.partition_counts = partition_counts.index.tolist(), partition_counts.values.tolist()
+
+        self.df = self.keys
+        self._group_codes = {}
+
+
+    def count_by_group(self, split:str, mask:np.ndarray) -> list:
+        """
+        Counts the tasks of the records selected by mask for every user or partition.
+        """
+        n_groups = len(self.users) if split=="User" else len(self.partitions)
+        # Records without user/partition (e.g. job steps) have group code -1 and are not counted
+        mask = mask & (self.get_group_codes(split) >= 0)
+        return list(np.bincount(self.get_group_codes(split)[mask], weights=self.n_tasks[mask], minlength=n_groups).astype(np.int64))
+
+
+    def get_basic_stats(self, split:str="Full") -> dict:
+        if split=="Full":
+            return {"n_start_end": self.n_tasks[self.started_and_ended].sum(),
+                    "n_start": self.n_tasks[self.started].sum(),
+                    "n_end": self.n_tasks[self.ended].sum()}
+        return super().get_basic_stats(split)
+
+
+    def get_core_utilization(self) -> dict:
+        # The store holds no timestamps, only days
+        return None
+
+
+    def get_termination_stats(self, split:str="Full") -> dict:
+        keys = ["n_complete", "n_cancelled", "n_failed", "n_timeout"]
+        states = self.states[self.started_and_ended]
+
+        if split=="Full":
+            return dict(zip(keys, states.sum(axis=0)))
+
+        elif split=="User" or split=="Partition":
+            n_groups = len(self.users) if split=="User" else len(self.partitions)
+            group_codes = self.get_group_codes(split)[self.started_and_ended]
+            valid = group_codes >= 0
+            return {key: list(np.bincount(group_codes[valid], weights=states[valid,i], minlength=n_groups).astype(np.int64))
+                    for i, key in enumerate(keys)}
+
+        raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
+
+
+    def get_task_sketches(self, split:str="Full") -> dict:
+        selected = np.flatnonzero(self.started_and_ended)
+
+        if split=="Full":
+            sketches_dict = {metric: QuantileSketch(self.relative_accuracy) for metric in METRICS}
+            for i in selected:
+                for metric in METRICS:
+                    sketches_dict[metric].merge(self.sketches[i][metric])
+            return sketches_dict
+
+        elif split=="User" or split=="Partition":
+            sketches_dict = {metric: {} for metric in METRICS}
+            for i in selected:
+                name = self.keys[split].iloc[i]
+                for metric in METRICS:
+                    sketches_dict[metric].setdefault(name, QuantileSketch(self.relative_accuracy)).merge(self.sketches[i][metric])
+            return sketches_dict
+
+        raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
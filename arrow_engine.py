@@ -0,0 +1,223 @@
+"""
+PyArrow engine for loading, cleaning and extracting stats (see engines.py).
+The dataset is streamed block by block with the multithreaded csv reader of PyArrow and every block
+is cleaned with PyArrow compute kernels, i.e. on the columnar Arrow data without converting it to
+pandas. Only the cleaned rows are kept. ArrowStatsExtractor computes the stats_dict of StatsExtractor
+directly on the resulting Arrow table; the results are identical to the pandas engine.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: path to csv file (dump of the database)
+OUT: cleaned pa.Table (same columns as data_cleaner), stats_dict
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+from data_cleaner import REL_COLS, SACCT_TIME_FORMAT, compact_dtypes
+from data_loader import CHUNK_SIZE
+from stats_extractor import StatsExtractor
+
+AVG_ROW_BYTES = 128 # to translate the chunk size (rows) into the block size (bytes) of the csv reader
+NULL_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+               "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"] # as pd.read_csv
+COLUMN_TYPES = {"Account": pa.string(), "User": pa.string(), "Partition": pa.string(), "Start": pa.string(),
+                "End": pa.string(), "CPUTimeRAW": pa.int64(), "ElapsedRaw": pa.int64(), "AllocCPUS": pa.int64(),
+                "State": pa.string()}
+
+
+def read_dataset_batches(dataset_path: str, block_size: int):
+    """
+    Reads the dataset block by block. Only the index column (JobID) and the relevant columns
+    defined in data_cleaner.REL_COLS are parsed.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str; path to pipe-separated csv file
+    block_size: int; number of bytes per block
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    tuple; (name of the index column, iterator of pa.RecordBatch)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    with open(dataset_path, "r") as file:
+        header = file.readline().rstrip("\n").split("|")
+    include_columns = [header[0]] + [col for col in REL_COLS if col in header]
+
+    # The index is read as string, as its type could change between blocks (e.g. job arrays '123_4')
+    reader = pa_csv.open_csv(dataset_path, read_options=pa_csv.ReadOptions(block_size=block_size, use_threads=True),
+                             parse_options=pa_csv.ParseOptions(delimiter="|"),
+                             convert_options=pa_csv.ConvertOptions(include_columns=include_columns,
+                                                                   column_types={header[0]: pa.string(), **COLUMN_TYPES},
+                                                                   null_values=NULL_VALUES, strings_can_be_null=True))
+    return header[0], reader
+
+
+def to_timestamps(timestamps: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    Parses sacct timestamps; sentinel values such as 'Unknown' or 'None' become null.
+    """
+    return pc.strptime(timestamps, format=SACCT_TIME_FORMAT, unit="s", error_is_null=True)
+
+
+def in_range(days: pa.ChunkedArray, first_day: pa.Scalar, end_day: pa.Scalar) -> pa.ChunkedArray:
+    """
+    Mask of days in [first_day, end_day); null days are not in the range.
+    """
+    return pc.fill_null(pc.and_(pc.greater_equal(days, first_day), pc.less(days, end_day)), False)
+
+
+def data_cleaner(table: pa.Table, index_col: str, account: str=None, period_start_date: str=None,
+                 period_end_date: str=None) -> pa.Table:
+    """
+    Cleans a block of the dataset like data_cleaner.data_cleaner, with PyArrow compute kernels:
+        * filter out data from one account
+        * update to consistent column names
+        * get start and end days of tasks from timestamps
+        * clean column 'State' to have consistent terminations reasons
+        * filter out data to get tasks which start or/and end in period and add the period columns
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    table: pa.Table
+    index_col: str; name of the index column
+    account: str or None
+    period_start_date: str or None; format='yyyy-mm-dd'
+    period_end_date: str or None; format='yyyy-mm-dd'
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    table: pa.Table; the index column, then the columns in the order of data_cleaner
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if account is not None:
+        table = table.filter(pc.equal(table["Account"], account))
+
+    start = to_timestamps(table["Start"])
+    end = to_timestamps(table["End"])
+    columns = {index_col: table[index_col], "Account": table["Account"], "User": table["User"],
+               "Partition": table["Partition"], "Start": start, "StartDate": pc.floor_temporal(start, unit="day"),
+               "End": end, "EndDate": pc.floor_temporal(end, unit="day"), "CPUTimeRaw": table["CPUTimeRAW"],
+               "ElapsedRaw": table["ElapsedRaw"], "AllocCPUS": table["AllocCPUS"],
+               "State": pc.if_else(pc.starts_with(table["State"], "CANCELLED"), "CANCELLED", table["State"])}
+    table = pa.table(columns)
+
+    if period_start_date is not None and period_end_date is not None:
+        # The period is the half-open interval [period_start, period_end + 1 day)
+        period_start = pa.scalar(pd.Timestamp(period_start_date), type=pa.timestamp("s"))
+        period_end = pa.scalar(pd.Timestamp(period_end_date) + pd.Timedelta(days=1), type=pa.timestamp("s"))
+        table = table.filter(pc.or_(in_range(table["StartDate"], period_start, period_end),
+                                    in_range(table["EndDate"], period_start, period_end)))
+        table = table.add_column(6, "PeriodStartDate", pa.repeat(period_start_date, len(table)))
+        table = table.add_column(9, "PeriodEndDate", pa.repeat(period_end_date, len(table)))
+
+    return table
+
+
+class ArrowEngine:
+
+
+    def __init__(self, chunksize: int=CHUNK_SIZE):
+        self.block_size = chunksize * AVG_ROW_BYTES
+
+
+    def load_dataset(self, dataset_path: str, account: str, period_start_date: str, period_end_date: str) -> pa.Table:
+        """
+        Streams the dataset from disk and returns the cleaned data of one account (or all accounts
+        if account is None) in the given period as pa.Table.
+        """
+        index_col, batches = read_dataset_batches(dataset_path, self.block_size)
+
+        cleaned_tables = []
+        for batch in batches:
+            cleaned_table = data_cleaner(pa.Table.from_batches([batch]), index_col, account=account,
+                                         period_start_date=period_start_date, period_end_date=period_end_date)
+            if len(cleaned_table) > 0:
+                cleaned_tables.append(cleaned_table)
+
+        # If no rows were selected (or the dataset has no rows), clean an empty table to get the column layout
+        if not cleaned_tables:
+            return data_cleaner(batches.schema.empty_table(), index_col, account=account,
+                                period_start_date=period_start_date, period_end_date=period_end_date)
+        return pa.concat_tables(cleaned_tables)
+
+
+    def stats_extractor(self, cleaned_dataset: pa.Table) -> StatsExtractor:
+        return ArrowStatsExtractor(cleaned_dataset)
+
+
+    def to_pandas(self, cleaned_dataset: pa.Table) -> pd.DataFrame:
+        """
+        Converts the cleaned table into the dataframe returned by data_cleaner.
+        """
+        # The index column (JobID) is the first column of the cleaned table
+        index_col = cleaned_dataset.column_names[0]
+        dataset = cleaned_dataset.to_pandas().set_index(index_col)
+        # Restore the numeric index if there are no job arrays
+        index = pd.to_numeric(dataset.index.to_series(), errors="coerce")
+        if index.notna().all():
+            dataset.index = pd.Index(index.astype(np.int64), name=index_col)
+        return compact_dtypes(dataset)
+
+
+    def memory_per_row(self, cleaned_dataset: pa.Table) -> float:
+        return cleaned_dataset.nbytes / len(cleaned_dataset) if len(cleaned_dataset) else 0.0
+
+
+class ArrowStatsExtractor(StatsExtractor):
+    """
+    Builds the stats_dict of StatsExtractor from a cleaned pa.Table. Counts, masks and codes are
+    computed with PyArrow compute kernels; the results are identical to StatsExtractor.
+    """
+
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self.account = table["Account"][0].as_py()
+        self.use_sketches = False
+
+        self.users, self.user_counts = self.get_value_counts("User")
+        self.partitions, self.partition_counts = self.get_value_counts("Partition")
+
+        # Masks of tasks which started/ended in period (null days compare as False, as NaT in StatsExtractor)
+        self.period_start_date = pd.Timestamp(table["PeriodStartDate"][0].as_py())
+        self.period_end_date = pd.Timestamp(table["PeriodEndDate"][0].as_py())
+        period_start = pa.scalar(self.period_start_date, type=pa.timestamp("s"))
+        period_end = pa.scalar(self.period_end_date, type=pa.timestamp("s"))
+        self.started = pc.fill_null(pc.greater_equal(table["StartDate"], period_start), False).to_numpy()
+        self.ended = pc.fill_null(pc.less_equal(table["EndDate"], period_end), False).to_numpy()
+        self.started_and_ended = self.started & self.ended
+
+        self.df = None
+        self._group_codes = {}
+        self._prorated_cpu_time = None
+
+
+    def get_value_counts(self, col: str) -> tuple:
+        """
+        Counts the tasks per label, like pd.Series.value_counts on the cleaned dataframe
+        (descending counts, ties in order of first appearance, missing labels are not counted).
+        """
+        value_counts = pc.value_counts(self.table[col])
+        labels = value_counts.field("values").to_pylist()
+        counts = value_counts.field("counts").to_numpy()
+        order = [i for i in np.argsort(-counts, kind="stable") if labels[i] is not None]
+        return [labels[i] for i in order], [int(counts[i]) for i in order]
+
+
+    def get_timestamps(self, col:str) -> np.ndarray:
+        return self.table[col].to_numpy()
+
+
+    def get_metric_values(self, metric:str) -> np.ndarray:
+        return self.table[metric].to_numpy()
+
+
+    def get_state_codes(self, states:list) -> np.ndarray:
+        return pc.fill_null(pc.index_in(self.table["State"], value_set=pa.array(states)), -1).to_numpy()
+
+
+    def get_group_codes(self, split:str) -> np.ndarray:
+        if split not in self._group_codes:
+            split_list = self.users if split=="User" else self.partitions
+            codes = pc.index_in(self.table[split], value_set=pa.array(split_list, type=pa.string()))
+            self._group_codes[split] = pc.fill_null(codes, -1).to_numpy().astype(np.intp)
+        return self._group_codes[split]
@@ -0,0 +1,84 @@
+"""
+Generates reports for several accounts at once.
+The dataset is loaded and cleaned only once, split by account with a single groupby and
+the reports (stats, visualizations, document) are built in parallel in a process pool.
+Every account gets its own output directory, which contains its fig/ directory and its report.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: cleaned dataframe of several accounts
+OUT: one report per account in output_root/<account>/
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from stats_extractor import StatsExtractor
+from data_visualizer import DataVisualizer, use_agg_backend
+from document_builder import build_document, get_fig_format
+from plot_config import set_plot_config
+
+
+def build_account_report(cleaned_dataset: pd.DataFrame, output_dir: str, doc_config: dict):
+    """
+    Builds the full report for the cleaned data of one account in output_dir.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    cleaned_dataset: pd.DataFrame; cleaned data of a single account
+    output_dir: str; directory to write figures and report to
+    doc_config: dict extracted from doc_config.json
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    output_dir: str
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats_dict = StatsExtractor(cleaned_dataset).extract_stats()
+
+    Viz = DataVisualizer(stats_dict, set_plot_config(fig_format=get_fig_format(doc_config)))
+    figures = Viz.render_all()
+
+    build_document(cleaned_dataset, stats_dict, doc_config, output_dir=output_dir, figures=figures)
+
+    return output_dir
+
+
+def build_batch_reports(cleaned_dataset: pd.DataFrame, doc_config: dict, output_root: str="reports",
+                        accounts: list=None, n_workers: int=None):
+    """
+    Splits the cleaned data of several accounts by account and builds one report per
+    account in a process pool.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    cleaned_dataset: pd.DataFrame; cleaned data (e.g. data_cleaner with account=None)
+    doc_config: dict extracted from doc_config.json
+    output_root: str; reports are written to output_root/<account>/
+    accounts: list of str or None; accounts to build reports for, None for all accounts
+    n_workers: int or None; number of worker processes, None for the number of CPUs
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dict; account -> output directory of its report
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if accounts is not None:
+        cleaned_dataset = cleaned_dataset[cleaned_dataset["Account"].isin(accounts)]
+
+    output_dirs = {}
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=use_agg_backend) as executor:
+
+        futures = {}
+        for account, account_dataset in cleaned_dataset.groupby("Account", sort=False, observed=True):
+            output_dir = os.path.join(output_root, str(account))
+            futures[executor.submit(build_account_report, account_dataset, output_dir, doc_config)] = account
+
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                output_dirs[account] = future.result()
+                print(f"... report finished for {account} ...")
+            except Exception as e:
+                print(f"... report failed for {account}: {e!r} ...")
+
+    return output_dirs
@@ -0,0 +1,223 @@
+"""
+Benchmark suite for the report pipeline.
+Generates synthetic datasets (data_generator.py) of the requested sizes and times and memory-profiles
+each of the five stages of main.main() separately:
+    1. load dataset       (relevant columns of the csv file)
+    2. clean dataset      (data_cleaner for the most active account and one month)
+    3. extract stats      (StatsExtractor.extract_stats)
+    4. create visualizations (DataVisualizer.render_all, without figure cache)
+    5. build document     (build_document; skipped if no TeX distribution is installed)
+For every stage, wall time, CPU time and peak RSS (high-water mark reset before the stage) are recorded.
+The peak traced memory (tracemalloc) is recorded in a second run of the stages, since tracing slows down
+the code too much for the times to be comparable. Results are appended to a JSON history file and compared
+to the previous run of the same size, so regressions are visible.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Usage:
+python benchmark.py [--rows 100000 1000000] [--history benchmark_history.json] [--data-dir bench_data] [--skip-document] [--skip-memory-trace]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import time
+import tracemalloc
+
+import pandas as pd
+
+from data_generator import generate_sacct_data
+from data_loader import read_dataset_chunks
+from data_cleaner import data_cleaner
+from stats_extractor import StatsExtractor
+from instrumentation import reset_peak_rss, get_peak_rss_mb
+
+START_DATE = "2021-03-01"
+END_DATE = "2021-03-31"
+
+
+def measure(stage: str, function, *args, trace_memory: bool=False, **kwargs):
+    """
+    Runs function(*args, **kwargs) and measures either wall time, CPU time and peak RSS of the stage
+    or, if trace_memory is True, its peak traced memory (tracemalloc slows down the code considerably,
+    so its runs are not timed).
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    stage: str; name of the stage
+    function: callable
+    trace_memory: bool; trace memory allocations instead of measuring time
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    tuple; (return value of function, dict of measurements)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if trace_memory:
+        tracemalloc.start()
+        result = function(*args, **kwargs)
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, {"stage": stage, "peak_traced_mb": round(peak_traced / 2**20, 2)}
+
+    # The high-water mark of the RSS is reset, so the peak refers to this stage (Linux)
+    reset_peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return result, {"stage": stage, "wall_s": round(wall_time, 4), "cpu_s": round(cpu_time, 4),
+                    "peak_rss_mb": round(get_peak_rss_mb(), 2)}
+
+
+def run_stages(dataset_path: str, account: str, report_dir: str, skip_document: bool=False,
+               trace_memory: bool=False) -> list:
+    """
+    Runs the five stages of the pipeline once and measures every stage (see measure).
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str; path to the dataset
+    account: str; account of the report
+    report_dir: str; directory for the report (emptied first)
+    skip_document: bool; skip stage 5
+    trace_memory: bool; trace memory allocations instead of measuring time
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list of dict; measurements of the stages
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    # Imported here, so that the stages before only pay for the modules they need
+    import matplotlib
+    matplotlib.use("Agg")
+    from data_visualizer import DataVisualizer
+    from document_builder import build_document, get_fig_format
+    from plot_config import set_plot_config
+
+    measurements = []
+
+    dataset, m = measure("load", lambda: pd.concat(read_dataset_chunks(dataset_path)), trace_memory=trace_memory)
+    measurements.append(m)
+    m["rows"] = len(dataset)
+
+    cleaned_dataset, m = measure("clean", data_cleaner, dataset, account=account, period_start_date=START_DATE,
+                                 period_end_date=END_DATE, trace_memory=trace_memory)
+    measurements.append(m)
+    m["rows"] = len(cleaned_dataset)
+    del dataset
+
+    stats_dict, m = measure("stats", lambda: StatsExtractor(cleaned_dataset).extract_stats(), trace_memory=trace_memory)
+    measurements.append(m)
+
+    # A new report directory, so the document is not skipped as unchanged (see latex_builder.compile_document)
+    shutil.rmtree(report_dir, ignore_errors=True)
+    os.makedirs(report_dir)
+    with open("doc_config.json", "r") as file:
+        doc_config = json.load(file)
+    plot_config = set_plot_config(fig_format=get_fig_format(doc_config))
+    plot_config["fig_cache_dir"] = None
+    figures, m = measure("plot", DataVisualizer(stats_dict, plot_config).render_all, trace_memory=trace_memory)
+    measurements.append(m)
+
+    # The LaTeX backend needs pdflatex, the HTML backend has no external dependencies
+    if skip_document or (doc_config.get("backend", "latex") == "latex" and shutil.which("pdflatex") is None):
+        measurements.append({"stage": "document", "skipped": True})
+    else:
+        _, m = measure("document", build_document, cleaned_dataset, stats_dict, doc_config, output_dir=report_dir,
+                       figures=figures, trace_memory=trace_memory)
+        measurements.append(m)
+
+    return measurements
+
+
+def run_benchmark(n_rows: int, data_dir: str, skip_document: bool=False, trace_memory: bool=True) -> dict:
+    """
+    Runs all stages of the pipeline on a synthetic dataset with n_rows tasks: once to measure
+    time and peak RSS and, if trace_memory is True, once more to trace memory allocations.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    n_rows: int; size of the dataset
+    data_dir: str; directory for the generated dataset (reused if it exists) and the report
+    skip_document: bool; skip stage 5
+    trace_memory: bool; add the peak traced memory of every stage (second run)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dict; run with its measurements
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    dataset_path = os.path.join(data_dir, f"sacct_{n_rows}.csv")
+    if not os.path.isfile(dataset_path):
+        print(f"... generating {n_rows} rows ...")
+        generate_sacct_data(n_rows, dataset_path)
+    account = "account-0000" # the generator's most active account
+    report_dir = os.path.join(data_dir, f"report_{n_rows}")
+
+    print(f"... benchmarking {n_rows} rows ...")
+    measurements = run_stages(dataset_path, account, report_dir, skip_document=skip_document)
+    if trace_memory:
+        print(f"... tracing memory of {n_rows} rows ...")
+        traced = run_stages(dataset_path, account, report_dir, skip_document=skip_document, trace_memory=True)
+        for m, t in zip(measurements, traced):
+            if "peak_traced_mb" in t:
+                m["peak_traced_mb"] = t["peak_traced_mb"]
+
+    for m in measurements:
+        if m.get("skipped"):
+            print(f"    {m['stage']:<10} skipped")
+            continue
+        traced = f"{m['peak_traced_mb']:>9.1f} MB" if "peak_traced_mb" in m else f"{'-':>12}"
+        print(f"    {m['stage']:<10} wall {m['wall_s']:>9.3f} s   cpu {m['cpu_s']:>9.3f} s   "
+              f"traced {traced}   rss {m['peak_rss_mb']:>9.1f} MB")
+
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": get_commit(),
+            "n_rows": n_rows, "stages": measurements}
+
+
+def get_commit() -> str:
+    """
+    Returns the current git commit hash (None if not in a git repository).
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_to_previous(run: dict, history: list):
+    """
+    Prints the wall time of every stage relative to the previous run of the same size.
+    """
+    previous_runs = [r for r in history if r["n_rows"] == run["n_rows"]]
+    if not previous_runs:
+        return
+    previous = {m["stage"]: m for m in previous_runs[-1]["stages"]}
+    print(f"    compared to {previous_runs[-1]['timestamp']} ({previous_runs[-1]['commit']}):")
+    for m in run["stages"]:
+        p = previous.get(m["stage"], {})
+        if "wall_s" in m and p.get("wall_s"):
+            ratio = m["wall_s"] / p["wall_s"]
+            flag = "   <-- regression" if ratio > 1.2 else ""
+            print(f"    {m['stage']:<10} {ratio:>6.2f}x{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the report pipeline.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--history", default="benchmark_history.json")
+    parser.add_argument("--data-dir", default="bench_data")
+    parser.add_argument("--skip-document", action="store_true")
+    parser.add_argument("--skip-memory-trace", action="store_true", help="skip the second run with tracemalloc")
+    args = parser.parse_args()
+
+    history = []
+    if os.path.isfile(args.history):
+        with open(args.history, "r") as file:
+            history = json.load(file)
+
+    for n_rows in args.rows:
+        run = run_benchmark(n_rows, args.data_dir, skip_document=args.skip_document,
+                            trace_memory=not args.skip_memory_trace)
+        compare_to_previous(run, history)
+        history.append(run)
+
+    with open(args.history, "w") as file:
+        json.dump(history, file, indent=2)
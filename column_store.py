@@ -0,0 +1,223 @@
+"""
+Memory-mapped column store of the numeric task fields.
+The dataset is converted once into one .npy file per column: start and end timestamps (datetime64[s]),
+the task metrics and integer codes of account, user, partition and state. The rows are sorted by
+account, so the tasks of an account are a contiguous slice. The files are opened with np.load(mmap_mode="r"):
+opening takes constant time regardless of the size of the history, only the pages of the requested
+account are read, and concurrent report processes share these pages through the page cache.
+ColumnStatsExtractor computes the stats_dict of StatsExtractor directly on the mapped arrays.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Layout:
+store_path/
+    _store_info.json        # number of rows, categories of the coded columns, row offsets of the accounts
+    Start.npy, End.npy      # datetime64[s], NaT if unknown
+    AllocCPUS.npy, ElapsedRaw.npy, CPUTimeRaw.npy
+    Account.npy, User.npy, Partition.npy, State.npy    # int32 codes into the categories, -1 if missing
+
+Usage:
+python column_store.py <dataset_path> <store_path>
+"""
+
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from data_cleaner import data_cleaner
+from data_loader import read_dataset_chunks, CHUNK_SIZE
+from period_query import PeriodQuery, to_day
+from stats_extractor import StatsExtractor
+
+STORE_INFO_FILE = "_store_info.json"
+TIME_COLS = ["Start", "End"]
+METRIC_COLS = {"AllocCPUS": np.int32, "ElapsedRaw": np.int64, "CPUTimeRaw": np.int64}
+CODE_COLS = ["Account", "User", "Partition", "State"]
+BLOCK_SIZE = 1_000_000 # rows per block when sorting the columns
+
+
+def _encode(values: pd.Series, lookup: dict) -> np.ndarray:
+    """
+    Codes values by the global lookup (label -> code), which is extended by new labels.
+    Missing values get code -1.
+    """
+    codes, uniques = pd.factorize(values)
+    global_codes = np.array([lookup.setdefault(label, len(lookup)) for label in uniques] + [-1], dtype=np.int32)
+    return global_codes[codes] # code -1 selects the trailing -1
+
+
+def build_column_store(dataset_path: str, store_path: str, chunksize: int=CHUNK_SIZE):
+    """
+    Converts the dataset into a column store. The dataset is streamed and cleaned chunk by chunk
+    (without account or period filter) and appended to unsorted staging files, which are finally
+    rewritten into .npy files sorted by account.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str; path to pipe-separated csv file
+    store_path: str; directory to write the store to (is replaced if it exists)
+    chunksize: int; number of rows per chunk
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    None
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if os.path.isdir(store_path):
+        shutil.rmtree(store_path)
+    staging_path = os.path.join(store_path, "_staging")
+    os.makedirs(staging_path)
+
+    dtypes = {**{col: np.dtype("datetime64[s]") for col in TIME_COLS},
+              **{col: np.dtype(dtype) for col, dtype in METRIC_COLS.items()},
+              **{col: np.dtype(np.int32) for col in CODE_COLS}}
+    lookups = {col: {} for col in CODE_COLS}
+    staging_files = {col: open(os.path.join(staging_path, col + ".bin"), "wb") for col in dtypes}
+    n_rows = 0
+
+    # Stream, clean and append every chunk to the staging files
+    try:
+        for chunk in read_dataset_chunks(dataset_path, chunksize=chunksize):
+            cleaned_chunk = data_cleaner(chunk)
+            for col in TIME_COLS + list(METRIC_COLS):
+                staging_files[col].write(cleaned_chunk[col].to_numpy().astype(dtypes[col]).tobytes())
+            for col in CODE_COLS:
+                staging_files[col].write(_encode(cleaned_chunk[col], lookups[col]).tobytes())
+            n_rows += len(cleaned_chunk)
+    finally:
+        for file in staging_files.values():
+            file.close()
+
+    # Sort all columns by account (stable, so the order of the dataset is kept within an account)
+    account_codes = np.fromfile(os.path.join(staging_path, "Account.bin"), dtype=np.int32)
+    order = np.argsort(account_codes, kind="stable")
+    account_counts = np.bincount(account_codes[account_codes >= 0], minlength=len(lookups["Account"]))
+    account_offsets = (account_codes < 0).sum() + np.concatenate(([0], np.cumsum(account_counts)))
+    del account_codes
+
+    for col, dtype in dtypes.items():
+        unsorted = np.memmap(os.path.join(staging_path, col + ".bin"), dtype=dtype, mode="r", shape=(n_rows,))
+        column = np.lib.format.open_memmap(os.path.join(store_path, col + ".npy"), mode="w+", dtype=dtype, shape=(n_rows,))
+        for first_row in range(0, n_rows, BLOCK_SIZE):
+            column[first_row:first_row + BLOCK_SIZE] = unsorted[order[first_row:first_row + BLOCK_SIZE]]
+        column.flush()
+        del unsorted, column
+    shutil.rmtree(staging_path)
+
+    with open(os.path.join(store_path, STORE_INFO_FILE), "w") as file:
+        json.dump({"n_rows": n_rows, "categories": {col: list(lookups[col]) for col in CODE_COLS},
+                   "account_offsets": account_offsets.tolist()}, file)
+
+
+class ColumnStore:
+
+
+    def __init__(self, store_path: str):
+        with open(os.path.join(store_path, STORE_INFO_FILE), "r") as file:
+            store_info = json.load(file)
+        self.n_rows = store_info["n_rows"]
+        self.categories = store_info["categories"]
+        self.account_offsets = store_info["account_offsets"]
+        self.columns = {col: np.load(os.path.join(store_path, col + ".npy"), mmap_mode="r")
+                        for col in TIME_COLS + list(METRIC_COLS) + CODE_COLS}
+
+
+    def get_account_slice(self, account: str) -> slice:
+        """
+        Returns the rows of an account (an empty slice if the account is unknown).
+        """
+        try:
+            code = self.categories["Account"].index(account)
+        except ValueError:
+            return slice(0, 0)
+        return slice(self.account_offsets[code], self.account_offsets[code + 1])
+
+
+class ColumnStatsExtractor(StatsExtractor):
+    """
+    Builds the stats_dict of StatsExtractor for an account and period from a ColumnStore.
+    The period is selected on the (memory-mapped) slice of the account; only the metrics
+    and codes of the selected tasks are read. The results are identical to StatsExtractor.
+    """
+
+
+    def __init__(self, store: ColumnStore, account: str, period_start_date: str, period_end_date: str):
+        rows = store.get_account_slice(account)
+        start_days = store.columns["Start"][rows].astype("datetime64[D]")
+        end_days = store.columns["End"][rows].astype("datetime64[D]")
+        selected = np.flatnonzero(PeriodQuery(start_days, end_days).mask(period_start_date, period_end_date))
+        if len(selected) == 0:
+            raise ValueError("No tasks for this account were recorded in the given time frame.")
+
+        self.store = store
+        self.account = account
+        self.use_sketches = False
+        self.rows = rows.start + selected
+        self.period_start_date = pd.to_datetime(period_start_date)
+        self.period_end_date = pd.to_datetime(period_end_date)
+
+        # Masks of tasks which started/ended in period (NaT compares as False, as in StatsExtractor)
+        self.started = start_days[selected] >= to_day(period_start_date, start_days.dtype)
+        self.ended = end_days[selected] <= to_day(period_end_date, end_days.dtype)
+        self.started_and_ended = self.started & self.ended
+
+        self.users, self.user_counts, self._user_lookup = self.get_value_counts("User")
+        self.partitions, self.partition_counts, self._partition_lookup = self.get_value_counts("Partition")
+
+        self.df = None
+        self._group_codes = {}
+        self._prorated_cpu_time = None
+
+
+    def get_value_counts(self, col: str) -> tuple:
+        """
+        Counts the selected tasks per label of a coded column, like pd.Series.value_counts on the
+        cleaned dataframe (descending counts, ties in order of first appearance).
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        col: str in ["User", or "Partition"].
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        tuple; (labels, counts, lookup of store code -> position in labels)
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        codes = self.store.columns[col][self.rows]
+        n_categories = len(self.store.categories[col])
+        present, first_positions = np.unique(codes[codes >= 0], return_index=True)
+        present = present[np.argsort(first_positions, kind="stable")]
+        counts = np.bincount(codes[codes >= 0], minlength=n_categories)[present]
+        order = np.argsort(-counts, kind="stable")
+        present, counts = present[order], counts[order]
+
+        lookup = np.full(n_categories + 1, -1, dtype=np.intp) # position n_categories: missing label (-1)
+        lookup[present] = np.arange(len(present))
+        labels = [self.store.categories[col][code] for code in present]
+        return labels, counts.tolist(), lookup
+
+
+    def get_timestamps(self, col:str) -> np.ndarray:
+        return self.store.columns[col][self.rows]
+
+
+    def get_metric_values(self, metric:str) -> np.ndarray:
+        return self.store.columns[metric][self.rows]
+
+
+    def get_state_codes(self, states:list) -> np.ndarray:
+        store_states = self.store.categories["State"]
+        lookup = np.array([states.index(state) if state in states else -1 for state in store_states] + [-1], dtype=np.intp)
+        return lookup[self.store.columns["State"][self.rows]]
+
+
+    def get_group_codes(self, split:str) -> np.ndarray:
+        if split not in self._group_codes:
+            lookup = self._user_lookup if split=="User" else self._partition_lookup
+            self._group_codes[split] = lookup[self.store.columns[split][self.rows]]
+        return self._group_codes[split]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python column_store.py <dataset_path> <store_path>")
+        sys.exit(1)
+    build_column_store(sys.argv[1], sys.argv[2])
@@ -1,6 +1,8 @@
 import pandas as pd
-from datetime import date
-from datetime import datetime, timedelta
+from pandas.api.types import union_categoricals
+
+from period_query import PeriodQuery
+from instrumentation import run_step
 
 """
 Cleans dataframe and prepare for further processing (e.g. to extracts stats)
@@ -9,33 +11,53 @@ IN: dataframe
 OUT: cleaned dataframe
 """
 
-def data_cleaner(dataset: pd.DataFrame, account:str, period_start_date:str, period_end_date:str):
+# Columns of the raw dataset which are needed for the report
+# (the textual durations 'CPUTime' and 'Elapsed' duplicate 'CPUTimeRAW' and 'ElapsedRaw' and are not read)
+REL_COLS = ['Account', 'User', 'Partition', 'Start', 'End', 'CPUTimeRAW', 'ElapsedRaw', 'AllocCPUS', 'State']
+
+# Columns of the cleaned dataset which are stored as categoricals resp. as the smallest sufficient integer type
+LABEL_COLS = ['Account', 'User', 'Partition', 'State', 'PeriodStartDate', 'PeriodEndDate']
+INT_COLS = ['CPUTimeRaw', 'ElapsedRaw', 'AllocCPUS']
+
+# Format of the timestamps in columns 'Start' and 'End'; other values ('Unknown', 'None', ...) become NaT
+SACCT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def data_cleaner(dataset: pd.DataFrame, account:str=None, period_start_date:str=None, period_end_date:str=None):
     """
     Execution of the individual steps to clean up the dataframe:
         * get relevant columns
+        * filter out data from one account
         * update to consistent column names
         * get start and end days of tasks from timestamps and add them as new columns
         * clean column 'State' to have consistent terminations reasons
         * filter out data to get tasks which start or/and end in period
         * add period start and end days as new columns to filtered data
-        * filter out data from one account
+        * store label columns as categoricals and integer columns in the smallest sufficient type
+    If account is None, the data of all accounts is kept. If the period is None,
+    the period filter is skipped and no period columns are added.
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Arguments:
     dataset: pd.DataFrame
-    period_start_date: str; format='yyyy-mm-dd'
-    period_end_date: str; format='yyyy-mm-dd'
+    account: str or None
+    period_start_date: str or None; format='yyyy-mm-dd'
+    period_end_date: str or None; format='yyyy-mm-dd'
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Returns:
     dataset: pd.DataFrame
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     """
-    subset = get_rel_cols(dataset) 
-    subset = update_to_consistent_cols_names(subset)
-    subset = add_start_and_end_date_cols(subset)
-    subset = clean_state_col(subset)
-    subset = get_rel_time_data(subset, period_start_date, period_end_date)
-    subset = add_per_start_and_end_date_cols(subset, period_start_date, period_end_date)
-    subset = get_account_data(subset, account)
+    subset = run_step("get_rel_cols", get_rel_cols, dataset)
+    if account is not None:
+        subset = run_step("get_account_data", get_account_data, subset, account)
+    subset = run_step("update_to_consistent_cols_names", update_to_consistent_cols_names, subset)
+    subset = run_step("add_start_and_end_date_cols", add_start_and_end_date_cols, subset)
+    subset = run_step("clean_state_col", clean_state_col, subset)
+    if period_start_date is not None and period_end_date is not None:
+        subset = run_step("get_rel_time_data", get_rel_time_data, subset, period_start_date, period_end_date)
+        subset = run_step("add_per_start_and_end_date_cols", add_per_start_and_end_date_cols, subset,
+                          period_start_date, period_end_date)
+    subset = run_step("compact_dtypes", compact_dtypes, subset)
     return subset
 
 
@@ -50,8 +72,7 @@ def get_rel_cols(dataset: pd.DataFrame):
     dataset: pd.DataFrame
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     """
-    dataset = dataset[['Account', 'User', 'Partition', 'Start', 'End', 'CPUTime', 'CPUTimeRAW', 'Elapsed',  
-                    'ElapsedRaw',  'AllocCPUS', 'State']]
+    dataset = dataset[REL_COLS]
     return dataset
 
 
@@ -86,9 +107,29 @@ def update_to_consistent_cols_names(dataset: pd.DataFrame):
     return dataset
     
 
+def parse_sacct_timestamps(timestamps: pd.Series):
+    """
+    Convert sacct timestamps (format 'yyyy-mm-ddThh:mm:ss') into datetime64 values in one pass.
+    Sentinel values such as 'Unknown' or 'None' (e.g. for tasks which did not end yet) become NaT.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    timestamps: pd.Series of str
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    timestamps: pd.Series of datetime64
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        return timestamps
+    # With an explicit format no inference is needed; everything that does not match
+    # the format (i.e. the sentinel values) is coerced to NaT
+    return pd.to_datetime(timestamps, format=SACCT_TIME_FORMAT, errors="coerce")
+
+
 def add_start_and_end_date_cols(dataset: pd.DataFrame):
     """
-    Add columns containing start and end days of tasks as datetime objects
+    Convert columns 'Start' and 'End' to datetime objects and add columns containing
+    start and end days of tasks (timestamps floored to the day)
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Arguments:
     dataset: pd.DataFrame
@@ -97,13 +138,11 @@ def add_start_and_end_date_cols(dataset: pd.DataFrame):
     dataset: pd.DataFrame
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     """
-    start_date = dataset['Start'].str.split('T').str[0]  
-    start_date_datetime = pd.to_datetime(start_date)
-    dataset.insert(4, 'StartDate', start_date_datetime)
-     
-    end_date = dataset['End'].str.split('T').str[0]  
-    end_date_datetime = pd.to_datetime(end_date)
-    dataset.insert(6, 'EndDate', end_date_datetime)
+    dataset['Start'] = parse_sacct_timestamps(dataset['Start'])
+    dataset.insert(4, 'StartDate', dataset['Start'].dt.floor('D'))
+
+    dataset['End'] = parse_sacct_timestamps(dataset['End'])
+    dataset.insert(6, 'EndDate', dataset['End'].dt.floor('D'))
     
     return dataset
 
@@ -120,15 +159,15 @@ def add_per_start_and_end_date_cols(dataset: pd.DataFrame, period_start_date:str
     dataset: pd.DataFrame
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
     """
-    dataset.insert(5, 'PeriodStartDate', period_start_date)
-    dataset.insert(8, 'PeriodEndDate', period_end_date)
+    dataset.insert(5, 'PeriodStartDate', pd.Categorical([period_start_date] * len(dataset)))
+    dataset.insert(8, 'PeriodEndDate', pd.Categorical([period_end_date] * len(dataset)))
     return dataset
 
     
 
 def get_rel_time_data(dataset: pd.DataFrame, period_start_date:str, period_end_date:str):
     """ 
-    Filter out data to get tasks which start or/and end in period
+    Filter out data to get tasks which start or/and end in period (see period_query.PeriodQuery)
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Arguments:
     dataset: pd.DataFrame
@@ -139,12 +178,8 @@ def get_rel_time_data(dataset: pd.DataFrame, period_start_date:str, period_end_d
     dataset: pd.DataFrame
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- -- 
     """
-    period_start_date_dt = pd.to_datetime(period_start_date)
-    period_end_date_dt = pd.to_datetime(period_end_date)
-
-    subset = dataset[(dataset['StartDate'] < period_start_date_dt) | (dataset['StartDate'] >= period_end_date_dt + timedelta(days=1))] # tasks that do not start in period
-    subset = subset[(subset['EndDate'] < period_start_date_dt) | (subset['EndDate'] >= period_end_date_dt + timedelta(days=1))] # tasks that additionally also do not end in period
-    dataset = dataset[~dataset.index.isin(subset.index)] # all tasks except those that neither start nor end in period
+    mask = PeriodQuery(dataset['StartDate'], dataset['EndDate']).mask(period_start_date, period_end_date)
+    dataset = dataset[mask]
 
     return dataset
 
@@ -164,4 +199,65 @@ def clean_state_col(dataset: pd.DataFrame):
     """
     mask = dataset['State'].str.startswith('CANCELLED')
     dataset.loc[mask,'State'] = 'CANCELLED'
-    return dataset
\ No newline at end of file
+    return dataset
+
+def compact_dtypes(dataset: pd.DataFrame):
+    """
+    Store the label columns (LABEL_COLS) as categoricals and the integer columns (INT_COLS) in the
+    smallest integer type which holds their values. Categories are kept in order of first appearance
+    and unused categories (e.g. after filtering) are removed.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    for col in LABEL_COLS:
+        if col not in dataset.columns:
+            continue
+        if isinstance(dataset[col].dtype, pd.CategoricalDtype):
+            dataset[col] = dataset[col].cat.remove_unused_categories()
+        else:
+            dataset[col] = pd.Categorical(dataset[col], categories=pd.unique(dataset[col].dropna()))
+
+    for col in INT_COLS:
+        if col in dataset.columns:
+            dataset[col] = pd.to_numeric(dataset[col], downcast='integer')
+    return dataset
+
+
+def concat_cleaned(datasets: list):
+    """
+    Concatenate cleaned dataframes (e.g. chunks) without losing the compact dtypes:
+    categoricals with different categories are unified first (pd.concat would fall back to object).
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    datasets: list of pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    for col in LABEL_COLS:
+        if col in datasets[0].columns and isinstance(datasets[0][col].dtype, pd.CategoricalDtype):
+            categories = union_categoricals([dataset[col].array for dataset in datasets]).categories
+            datasets = [dataset.assign(**{col: dataset[col].cat.set_categories(categories)}) for dataset in datasets]
+    return pd.concat(datasets)
+
+
+def memory_per_row(dataset: pd.DataFrame):
+    """
+    Bytes per row of the dataframe (including index and the contents of object columns)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    float
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if len(dataset) == 0:
+        return 0.0
+    return dataset.memory_usage(index=True, deep=True).sum() / len(dataset)
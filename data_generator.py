@@ -0,0 +1,164 @@
+"""
+Generates synthetic sacct dumps in the format of the dataset (pipe-separated, JobID as first column)
+with the columns data_cleaner.get_rel_cols expects, e.g. for benchmarks or tests at scale.
+The data is skewed like real accounting data:
+    * few accounts and users run most of the tasks (Zipf-like weights), users belong to one account
+    * most tasks run on the default partition
+    * task durations are log-normal and capped by the time limit of the partition
+      (tasks reaching the limit are TIMEOUT)
+    * states include 'CANCELLED by <uid>' and tasks which are still running (End 'Unknown')
+    * some rows are job steps ('<JobID>.batch') without User and Partition, as in sacct output without -X
+Rows are written in chunks, so 10^8 rows do not have to fit into memory.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Usage:
+python data_generator.py <n_rows> <path or - for stdout> [--seed SEED] [--start-date YYYY-MM-DD] [--days DAYS]
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["JobID", "JobName", "Account", "User", "Partition", "Start", "End", "CPUTime", "CPUTimeRAW",
+           "Elapsed", "ElapsedRaw", "AllocCPUS", "State"]
+
+PARTITIONS = {"fuchs": (0.55, 3 * 86400), "kepler": (0.25, 7 * 86400), "gpu": (0.12, 2 * 86400),
+              "debug": (0.05, 3600), "bigmem": (0.03, 14 * 86400)} # name: (share of tasks, time limit in s)
+STATES = {"COMPLETED": 0.70, "FAILED": 0.10, "CANCELLED": 0.04, "CANCELLED by": 0.08, "RUNNING": 0.02} # TIMEOUT: at time limit
+ALLOC_CPUS = {1: 0.35, 2: 0.10, 4: 0.15, 8: 0.12, 16: 0.12, 32: 0.08, 64: 0.06, 128: 0.02}
+STEP_SHARE = 0.05 # share of rows which are job steps (empty User and Partition)
+CHUNK_SIZE = 1_000_000
+
+
+def zipf_weights(n: int, exponent: float=1.2) -> np.ndarray:
+    """
+    Returns normalized weights 1/k**exponent for k = 1..n.
+    """
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def format_duration(seconds: np.ndarray) -> pd.Series:
+    """
+    Formats durations like sacct: [D-]HH:MM:SS
+    """
+    days, rest = np.divmod(seconds, 86400)
+    hours, rest = np.divmod(rest, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    hms = (pd.Series(hours).astype(str).str.zfill(2) + ":" + pd.Series(minutes).astype(str).str.zfill(2)
+           + ":" + pd.Series(secs).astype(str).str.zfill(2))
+    return hms.where(days == 0, pd.Series(days).astype(str) + "-" + hms)
+
+
+def generate_chunk(rng: np.random.Generator, first_job_id: int, n_rows: int, accounts: np.ndarray,
+                   users: np.ndarray, user_accounts: np.ndarray, period_start: pd.Timestamp, n_seconds: int) -> pd.DataFrame:
+    """
+    Generates one chunk of n_rows tasks with JobIDs starting at first_job_id.
+    """
+    user_idx = rng.choice(len(users), size=n_rows, p=zipf_weights(len(users)))
+
+    partition_names = np.array(list(PARTITIONS))
+    partition_idx = rng.choice(len(PARTITIONS), size=n_rows, p=[share for share, _ in PARTITIONS.values()])
+    time_limits = np.array([limit for _, limit in PARTITIONS.values()])[partition_idx]
+
+    alloc_cpus = rng.choice(list(ALLOC_CPUS), size=n_rows, p=list(ALLOC_CPUS.values()))
+
+    # Log-normal durations (median ~ 20 min), tasks reaching the time limit time out
+    elapsed = np.minimum(rng.lognormal(mean=7.1, sigma=2.0, size=n_rows).astype(np.int64), time_limits)
+
+    state_names = np.array(list(STATES) + ["TIMEOUT"])
+    state_idx = rng.choice(len(STATES), size=n_rows, p=np.array(list(STATES.values())) / sum(STATES.values()))
+    state_idx[elapsed >= time_limits] = len(STATES)
+    states = pd.Series(state_names[state_idx])
+    cancelled_by = states == "CANCELLED by"
+    states[cancelled_by] = "CANCELLED by " + pd.Series(rng.integers(1000, 60000, size=n_rows)).astype(str)[cancelled_by]
+
+    # Tasks are sorted by start time, as in sacct dumps
+    start = period_start + pd.to_timedelta(np.sort(rng.integers(0, n_seconds, size=n_rows)), unit="s")
+    end = start + pd.to_timedelta(elapsed, unit="s")
+    running = (states == "RUNNING").to_numpy()
+
+    # Job steps only carry the account, sacct leaves User and Partition empty
+    job_ids = np.arange(first_job_id, first_job_id + n_rows).astype(str)
+    steps = rng.random(n_rows) < STEP_SHARE
+
+    chunk = pd.DataFrame({
+        "JobID": np.where(steps, np.char.add(job_ids, ".batch"), job_ids),
+        "JobName": np.where(steps, "batch", "job"),
+        "Account": accounts[user_accounts[user_idx]],
+        "User": np.where(steps, "", users[user_idx]),
+        "Partition": np.where(steps, "", partition_names[partition_idx]),
+        "Start": start.strftime("%Y-%m-%dT%H:%M:%S"),
+        "End": np.where(running, "Unknown", end.strftime("%Y-%m-%dT%H:%M:%S")),
+        "CPUTime": format_duration(elapsed * alloc_cpus),
+        "CPUTimeRAW": elapsed * alloc_cpus,
+        "Elapsed": format_duration(elapsed),
+        "ElapsedRaw": elapsed,
+        "AllocCPUS": alloc_cpus,
+        "State": states,
+    })
+    return chunk[COLUMNS]
+
+
+def generate_sacct_data(n_rows: int, file, seed: int=0, start_date: str="2021-01-01", n_days: int=365,
+                        n_accounts: int=None, chunksize: int=CHUNK_SIZE):
+    """
+    Writes a synthetic sacct dump with n_rows tasks.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    n_rows: int; number of tasks
+    file: str or file object; path or open text file to write to
+    seed: int; seed of the random number generator
+    start_date: str; format='yyyy-mm-dd'; first day of the generated time frame
+    n_days: int; length of the generated time frame; tasks are spread evenly over the days
+    n_accounts: int or None; number of accounts; default: grows with n_rows
+    chunksize: int; number of rows generated and written at once
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list of str; account names, most active account first
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    rng = np.random.default_rng(seed)
+
+    if n_accounts is None:
+        n_accounts = int(np.clip(np.sqrt(n_rows) / 10, 5, 2000))
+    accounts = np.array([f"account-{i:04d}" for i in range(n_accounts)])
+
+    # Every account has 1 to 50 users; the first (most active) users belong to the most active accounts
+    n_users_per_account = np.clip(rng.zipf(1.8, size=n_accounts), 1, 50)
+    user_accounts = np.repeat(np.arange(n_accounts), n_users_per_account)
+    users = np.array([f"user-{i:05d}" for i in range(len(user_accounts))])
+
+    period_start = pd.Timestamp(start_date)
+    n_seconds_per_row = n_days * 86400 / n_rows
+
+    close_file = isinstance(file, str)
+    if close_file:
+        file = open(file, "w")
+    try:
+        file.write("|".join(COLUMNS) + "\n")
+        for first_row in range(0, n_rows, chunksize):
+            n_chunk_rows = min(chunksize, n_rows - first_row)
+            chunk_start = period_start + pd.to_timedelta(int(first_row * n_seconds_per_row), unit="s")
+            chunk = generate_chunk(rng, first_row + 1, n_chunk_rows, accounts, users, user_accounts,
+                                   chunk_start, max(int(n_chunk_rows * n_seconds_per_row), 1))
+            chunk.to_csv(file, sep="|", index=False, header=False)
+    finally:
+        if close_file:
+            file.close()
+
+    return accounts.tolist()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic sacct dump.")
+    parser.add_argument("n_rows", type=int)
+    parser.add_argument("path", help="output path, - for stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-date", default="2021-01-01")
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    generate_sacct_data(args.n_rows, sys.stdout if args.path == "-" else args.path, seed=args.seed,
+                        start_date=args.start_date, n_days=args.days)
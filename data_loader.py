@@ -0,0 +1,92 @@
+"""
+Loads the dataset in bounded chunks and cleans every chunk on the fly, so that only
+the rows of the requested account and time frame are ever held in memory.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: path to csv file (dump of the database)
+OUT: cleaned dataframe
+"""
+
+import pandas as pd
+
+from data_cleaner import data_cleaner, concat_cleaned, REL_COLS
+
+CHUNK_SIZE = 500_000
+
+
+def read_dataset_chunks(dataset_path, chunksize: int=CHUNK_SIZE, header: list=None):
+    """
+    Reads the dataset chunk by chunk. Only the index column (JobID) and the
+    relevant columns defined in data_cleaner.REL_COLS are parsed.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str or file object; path to pipe-separated csv file, or a file object
+                  positioned after the header line (requires header)
+    chunksize: int; number of rows per chunk
+    header: list of str or None; column names of a dataset without header line, None to read the header line
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    iterator of pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if header is None:
+        columns = pd.read_csv(dataset_path, sep="|", nrows=0).columns
+        header_kwargs = {}
+    else:
+        columns = header
+        header_kwargs = {"header": None, "names": header}
+    use_cols = [columns[0]] + [col for col in REL_COLS if col in columns]
+
+    return pd.read_csv(dataset_path, sep="|", index_col=0, usecols=use_cols,
+                       dtype={"Start": str, "End": str}, chunksize=chunksize, **header_kwargs)
+
+
+def clean_chunks(chunks, account: str, period_start_date: str, period_end_date: str):
+    """
+    Cleans every chunk with data_cleaner (which filters by account first) and
+    concatenates the (small) results.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    chunks: iterable of pd.DataFrame
+    account: str
+    period_start_date: str; format='yyyy-mm-dd'
+    period_end_date: str; format='yyyy-mm-dd'
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    cleaned_chunks = []
+    cleaned_chunk = None
+    for chunk in chunks:
+        cleaned_chunk = data_cleaner(chunk, account=account, period_start_date=period_start_date,
+                                     period_end_date=period_end_date)
+        if len(cleaned_chunk) > 0:
+            cleaned_chunks.append(cleaned_chunk)
+
+    # If no rows were selected, return the last (empty) chunk to preserve the column layout
+    if not cleaned_chunks:
+        return cleaned_chunk
+
+    return concat_cleaned(cleaned_chunks)
+
+
+def load_dataset(dataset_path: str, account: str, period_start_date: str, period_end_date: str,
+                 chunksize: int=CHUNK_SIZE):
+    """
+    Streams the dataset from disk and returns the cleaned data of one account
+    in the given period. Equivalent to data_cleaner(pd.read_csv(...), ...), but
+    peak memory depends on the chunk size and the selected rows only.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str; path to pipe-separated csv file
+    account: str
+    period_start_date: str; format='yyyy-mm-dd'
+    period_end_date: str; format='yyyy-mm-dd'
+    chunksize: int; number of rows per chunk
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    chunks = read_dataset_chunks(dataset_path, chunksize=chunksize)
+    return clean_chunks(chunks, account, period_start_date, period_end_date)
@@ -1,48 +1,207 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 
 import matplotlib.colors as colors
 import matplotlib.cm as cmx
 
+from figure_cache import FigureCache, content_hash
+
+# plot_config entries which do not change how a figure looks
+NON_RENDERING_CONFIG = ['n_workers', 'fig_cache_dir', 'fig_cache_max_bytes']
+
 #####################
 ## DATA VISUALIZER ##
 #####################
 
+def use_agg_backend():
+    """
+    Switches matplotlib to the non-interactive Agg backend (used in worker processes).
+    """
+    matplotlib.use("Agg")
+
+
+def render_figure(method:str, kwargs:dict, stats_dict:dict, plot_config:dict) -> bytes:
+    """
+    Renders a single figure into an in-memory buffer, e.g. in a worker process.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    method: str; name of the DataVisualizer plot method
+    kwargs: dict; arguments of the plot method
+    stats_dict: dict; (slice of the) stats_dict
+    plot_config: dict
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    bytes; the figure in plot_config['fig_format']
+    """
+    buffer = io.BytesIO()
+    getattr(DataVisualizer(stats_dict, plot_config), method)(export_path=buffer, **kwargs)
+    return buffer.getvalue()
+
+
 class DataVisualizer:
 
-    def __init__(self, stats_dict:dict, plot_config:dict=None):
+    def __init__(self, stats_dict:dict, plot_config:dict=None, fig_dir:str="fig"):
         
         self.stats_dict = stats_dict
         self.plot_config = plot_config
+        self.fig_dir = fig_dir
 
-    def plot_all(self):
+    def plot_all(self, n_workers:int=None):
         """
-        Generates all visualizations suitable for a report based on its stats_dict.
+        Generates all visualizations suitable for a report based on its stats_dict
+        (see render_all) and stores them in self.fig_dir (default: "fig/").
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Arguments:
+        n_workers: int or None; number of worker processes, None for plot_config['n_workers'] (default: 1)
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
         None
+        """
+        fig_format = self.plot_config.get('fig_format', 'jpg')
+        for name, figure in self.render_all(n_workers).items():
+            with open(os.path.join(self.fig_dir, f"{name}.{fig_format}"), "wb") as file:
+                file.write(figure)
+
+
+    def render_all(self, n_workers:int=None) -> dict:
+        """
+        Renders all visualizations suitable for a report based on its stats_dict into in-memory
+        buffers in plot_config['fig_format'] (e.g. "pdf", "svg", "png", "jpg") with plot_config['dpi'].
+        The buffers can be passed to build_document directly.
+        If n_workers > 1, the figures are rendered in parallel in worker processes.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        n_workers: int or None; number of worker processes, None for plot_config['n_workers'] (default: 1)
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        dict; name of the figure (e.g. "basic_stats_full") -> bytes
+        """
+
+        if n_workers is None:
+            n_workers = self.plot_config.get('n_workers', 1)
+
+        figure_jobs = self.get_figure_jobs()
+        fig_format = self.plot_config.get('fig_format', 'jpg')
+        figures = {}
+
+        # Reuse figures which were rendered before from exactly the same content
+        cache = None
+        if self.plot_config.get('fig_cache_dir'):
+            cache = FigureCache(self.plot_config['fig_cache_dir'], self.plot_config.get('fig_cache_max_bytes', 200_000_000))
+            for job in figure_jobs:
+                job["key"] = self.get_figure_key(job)
+                figures[job["name"]] = cache.get_bytes(job["key"], "." + fig_format)
+            figure_jobs = [job for job in figure_jobs if figures[job["name"]] is None]
+
+        if n_workers > 1 and len(figure_jobs) > 1:
+            # Only the small stats_dict slice of each figure is sent to the workers
+            with ProcessPoolExecutor(max_workers=min(n_workers, len(figure_jobs)), initializer=use_agg_backend) as executor:
+                futures = [executor.submit(render_figure, job["method"], job["kwargs"], job["stats"], self.plot_config)
+                           for job in figure_jobs]
+                for job, future in zip(figure_jobs, futures):
+                    figures[job["name"]] = future.result()
+        else:
+            for job in figure_jobs:
+                buffer = io.BytesIO()
+                getattr(self, job["method"])(export_path=buffer, **job["kwargs"])
+                figures[job["name"]] = buffer.getvalue()
+
+        if cache is not None:
+            for job in figure_jobs:
+                cache.put_bytes(job["key"], "." + fig_format, figures[job["name"]])
+
+        return figures
+
+
+    def export_figure(self, export_path=None):
+        """
+        Exports the current figure in plot_config['fig_format'] with plot_config['dpi'],
+        or displays it if no export path is given.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        export_path: None, path (the file ending is added if missing) or binary file object (e.g. io.BytesIO)
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Returns:
         None
         """
-        
+        if not export_path:
+            plt.show()
+            return
+
+        fig_format = self.plot_config.get('fig_format', 'jpg')
+        # If export path has no file ending, add one
+        if isinstance(export_path, str) and export_path.split(".")[-1] != fig_format:
+            export_path = export_path + "." + fig_format
+        # Omit the creation date, so the same figure always results in the same bytes
+        metadata = {"pdf": {"CreationDate": None}, "svg": {"Date": None}}.get(fig_format)
+        with plt.rc_context({"svg.hashsalt": "report"}):
+            plt.savefig(export_path, format=fig_format, dpi=self.plot_config['dpi'], metadata=metadata)
+        plt.close()
+
+
+    def get_figure_key(self, figure_job:dict) -> str:
+        """
+        Hashes everything a figure is rendered from: plot method, arguments, stats_dict slice,
+        plot_config entries relevant for rendering, matplotlib version.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        figure_job: dict; as returned by get_figure_jobs
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        str; hash of the figure
+        """
+        plot_config = {k:v for k,v in self.plot_config.items() if k not in NON_RENDERING_CONFIG}
+        return content_hash({"method":figure_job["method"], "kwargs":figure_job["kwargs"], "stats":figure_job["stats"],
+                             "plot_config":plot_config, "matplotlib":matplotlib.__version__})
+
+
+    def get_figure_jobs(self) -> list:
+        """
+        Lists all figures suitable for a report based on its stats_dict.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        list of dicts with keys
+            "name": name of the figure,
+            "method": name of the plot method,
+            "kwargs": arguments of the plot method,
+            "stats": slice of the stats_dict needed for the figure.
+        """
+
+        figure_jobs = []
+
+        def add_job(method, name, stats, **kwargs):
+            figure_jobs.append({"name":name, "method":method, "kwargs":kwargs, "stats":stats})
+
         # Basic stats
-        self.plot_basic_stats(split="full", export_path="fig/basic_stats_full.jpg")
-        if "user_split" in self.stats_dict.keys():
-            self.plot_basic_stats(split="user_split", export_path="fig/basic_stats_user_split.jpg")
-        if "partition_split" in self.stats_dict.keys():
-            self.plot_basic_stats(split="partition_split", export_path="fig/basic_stats_partition_split.jpg")
+        add_job("plot_basic_stats", "basic_stats_full", {"full":{"basic_stats":self.stats_dict["full"]["basic_stats"]}}, split="full")
+        for split in ["user_split", "partition_split"]:
+            if split in self.stats_dict.keys():
+                add_job("plot_basic_stats", f"basic_stats_{split}", {split:self.stats_dict[split]}, split=split)
 
         # Task metrics
-        self.plot_task_metrics(split="full", export_path="fig/task_metrics_full.jpg")
+        add_job("plot_task_metrics", "task_metrics_full", {"full":{"task_metrics":self.stats_dict["full"]["task_metrics"]}}, split="full")
         if "user_split" in self.stats_dict.keys() and any([count>=10 for count in self.stats_dict["user_split"]["user_counts"]]):
-            self.plot_task_metrics(split="user_split", export_path="fig/task_metrics_user_split.jpg")
+            add_job("plot_task_metrics", "task_metrics_user_split", {"user_split":self.stats_dict["user_split"]}, split="user_split")
         if "partition_split" in self.stats_dict.keys() and any([count>=10 for count in self.stats_dict["partition_split"]["partition_counts"]]):
-            self.plot_task_metrics(split="partition_split", export_path="fig/task_metrics_partition_split.jpg")
+            add_job("plot_task_metrics", "task_metrics_partition_split", {"partition_split":self.stats_dict["partition_split"]}, split="partition_split")
 
         # Termination stats
-        self.plot_termination_stats(export_path="fig/termination_stats_full.jpg")
+        add_job("plot_termination_stats", "termination_stats_full", {"full":{"termination_stats":self.stats_dict["full"]["termination_stats"]}})
+
+        # Core utilization
+        if "core_utilization" in self.stats_dict["full"].keys():
+            add_job("plot_core_utilization", "core_utilization_full", {"full":{"core_utilization":self.stats_dict["full"]["core_utilization"]}})
+
+        return figure_jobs
 
 
     def plot_basic_stats(self, split:str="full", export_path:str=None):
@@ -51,7 +210,7 @@ class DataVisualizer:
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Arguments:
         split: str in ["full", "user_split", "partition"_split"]
-        export_path: None or path to export plot to
+        export_path: None, path or binary file object to export plot to
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Returns:
         None
@@ -120,14 +279,7 @@ class DataVisualizer:
                 fig.tight_layout()
 
         # Export plot if requested, else just display it
-        if export_path:
-            # If export path has no file ending, add one
-            if export_path.split(".")[-1] == "jpg":
-                plt.savefig(export_path, dpi=self.plot_config['dpi'])
-            else:
-                plt.savefig(export_path+".jpg", dpi=self.plot_config['dpi'])
-        else:
-            plt.show()
+        self.export_figure(export_path)
             
 
     def plot_task_metrics(self, split:str="full", export_path:str=None):
@@ -136,7 +288,7 @@ class DataVisualizer:
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Arguments:
         split: str in ["full", "user_split", "partition_split"]
-        export_path: None or path to export plot to
+        export_path: None, path or binary file object to export plot to
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Returns:
         None
@@ -234,14 +386,7 @@ class DataVisualizer:
                 fig.autofmt_xdate()
     
         # Export plot if requested, else just display it
-        if export_path:
-            # If export path has no file ending, add one
-            if export_path.split(".")[-1] == "jpg":
-                plt.savefig(export_path, dpi=self.plot_config['dpi'])
-            else:
-                plt.savefig(export_path+".jpg", dpi=self.plot_config['dpi'])
-        else:
-            plt.show()
+        self.export_figure(export_path)
                 
 
     def plot_termination_stats(self, export_path=None):
@@ -249,7 +394,7 @@ class DataVisualizer:
         Plots termination stats in a donut chart.
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Arguments:
-        export_path: None or path to export plot to
+        export_path: None, path or binary file object to export plot to
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Returns:
         None
@@ -285,14 +430,44 @@ class DataVisualizer:
 
         plt.tight_layout()
         # Export plot if requested, else just display it
-        if export_path:
-            # If export path has no file ending, add one
-            if export_path.split(".")[-1] == "jpg":
-                plt.savefig(export_path, dpi=self.plot_config['dpi'])
-            else:
-                plt.savefig(export_path+".jpg", dpi=self.plot_config['dpi'])
-        else:
-            plt.show()
+        self.export_figure(export_path)
+
+
+    def plot_core_utilization(self, export_path=None):
+        """
+        Plots the number of CPUs allocated at the same time over the time frame
+        (mean and max per bin) with the time-weighted mean and 95th percentile.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        export_path: None, path or binary file object to export plot to
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        None
+        """
+
+        data = self.stats_dict['full']['core_utilization']
+        bin_start = np.array(data['bin_start'], dtype='datetime64[m]')
+        # Step curves need the end of the last bin
+        x = np.append(bin_start, bin_start[-1] + np.timedelta64(data['bin_hours'], 'h'))
 
+        fig, ax = plt.subplots(figsize=(9,4))
 
+        ax.fill_between(x, np.append(data['bin_mean'], data['bin_mean'][-1]), step='post', color=self.plot_config['c_map'](0.4), label='Mean per bin')
+        ax.step(x, np.append(data['bin_max'], data['bin_max'][-1]), where='post', color=self.plot_config['c_map'](0.9), linewidth=0.8, label='Max per bin')
+        ax.axhline(data['mean'], color='black', linestyle=':', linewidth=1, label=f"Mean ({round(data['mean'])})")
+        ax.axhline(data['p95'], color='black', linestyle='--', linewidth=1, label=f"95th percentile ({data['p95']})")
 
+        ax.set_ylabel('Allocated CPUs', fontsize=self.plot_config['label_font_size'], labelpad=self.plot_config['label_pad'])
+        ax.set_xlim(x[0], x[-1])
+        ax.set_ylim(0, None)
+
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.yaxis.grid(linestyle=":")
+
+        ax.legend(loc='best', fontsize=self.plot_config['leg_font_size'])
+        fig.autofmt_xdate()
+        fig.tight_layout()
+
+        # Export plot if requested, else just display it
+        self.export_figure(export_path)
@@ -1,297 +1,98 @@
-import numpy as np
+"""
+Entry point of the report: build_document writes the report with the backend chosen in
+doc_config["backend"], i.e. LaTeX (latex_builder.py, needs pylatex and pdflatex) or HTML
+(html_builder.py). The backends are imported on demand; this module only holds what they share.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: cleaned dataframe, stats_dict, doc_config, figures (in memory or in fig/)
+OUT: report in output_dir
+"""
+
+import os
+
 import pandas as pd
-from pylatex import Document, Tabularx, Document, Section, Subsection, Command, Itemize, Enumerate, Description, Figure, Table, Tabular, Label, Ref, Marker
-from pylatex.utils import bold, italic, NoEscape
-from stats_extractor import StatsExtractor
-from data_visualizer import DataVisualizer
 
-def build_table(doc:Document, data: np.ndarray, col_names: list=None,
-                index:list=None, position_codes:list=None):
+# Output backend (doc_config["backend"]) -> figure formats it can include (the first is the default)
+BACKENDS = {"latex": ["pdf", "png", "jpg"], "html": ["svg", "png", "jpg"]}
+
+
+def get_fig_format(doc_config:dict) -> str:
     """
-    Writes a table on an input document based on a data array.
+    Returns the format of the figures (doc_config["fig_format"], or the default of the backend).
+    """
+    backend = doc_config.get("backend", "latex")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', please choose one of {list(BACKENDS)}.")
+    fig_format = doc_config.get("fig_format", BACKENDS[backend][0])
+    if fig_format not in BACKENDS[backend]:
+        raise ValueError(f"The {backend} backend cannot include '{fig_format}' figures, please choose one of {BACKENDS[backend]}.")
+    return fig_format
+
+
+def write_figures(figures: dict, fig_dir: str, fig_format: str):
+    """
+    Writes figures rendered into memory (DataVisualizer.render_all) to fig_dir.
+    Files with unchanged content are not rewritten.
+    """
+    os.makedirs(fig_dir, exist_ok=True)
+    for name, figure in figures.items():
+        path = os.path.join(fig_dir, f"{name}.{fig_format}")
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                if file.read() == figure:
+                    continue
+        with open(path, "wb") as file:
+            file.write(figure)
+
+
+def core_utilization_text(data: dict, task_metrics_ref: str, termination_stats_ref: str, escape=lambda text: text) -> str:
+    """
+    Text of the Core Utilization section, shared by the LaTeX and the HTML backend. The sections
+    of the task metrics and the termination stats are referenced by the backend (e.g. with \\ref),
+    so the text stays correct if sections are added or reordered.
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Arguments:
-    doc: pylatex.Document; document to write on.
-    data: 2D np.ndarray; data to include in table.
-    col_names: list of strings.
-    index: list of strings.
-    position_codes: list of strings;
-                    indicates text position in columns;
-                    e.g. \begin{tabular}{l c c} would require ["l", "c", "c"] as input.
+    data: dict; stats_dict["full"]["core_utilization"]
+    task_metrics_ref: str; reference to the Task Metrics section
+    termination_stats_ref: str; reference to the Termination Stats section
+    escape: function; escapes the text around the references for the backend
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Returns:
-    None
+    str
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     """
+    return (escape(f"Over the given time frame, the work group held {round(data['mean'])} CPUs at the same time "
+                   f"on average. At the peak, {data['peak']} CPUs were allocated at once, and for 95 % of the time "
+                   f"at most {data['p95']} CPUs were allocated. In contrast to Sections ")
+            + task_metrics_ref + escape(" and ") + termination_stats_ref
+            + escape(", all tasks which started or ended in the given time frame are considered; "
+                     "tasks which were still running are counted until the end of the time frame."))
 
-    # Get data dimensions
-    m, n = data.shape
-
-    # Check if col_names have correct dimension
-    if not col_names or len(col_names) != n:
-        col_names = [f"col{i}" for i in range(n)]
-
-    # Check if index has correct dimension
-    if index and len(index) != m:
-        index = None
 
-    # Get (or generate) positional codes
-    if not position_codes or len(position_codes) != n:
-        position_codes = " ".join("c" for i in range(n))
-        if index:
-            position_codes = "l | " + position_codes
-
-    # Generate table
-    with doc.create(Tabularx(position_codes)) as table:
-
-        # Add header
-        if not index:
-            table.add_row(col_names, mapper=bold)
-        else:
-            table.add_row([""] + col_names, mapper=bold)
-        table.add_hline()
-        #table.end_table_header()
-        
-        # Add data
-        for i in range(m):
-            if not index:
-                table.add_row([data[i,:]])
-            else:
-                table.add_row([index[i]] + list(data[i,:]))
-        table.add_hline()
-
-def build_document(df: pd.DataFrame, stats_dict: dict, doc_config:dict):
+def build_document(df: pd.DataFrame, stats_dict: dict, doc_config:dict, output_dir:str=".", figures:dict=None):
     """
-    Writes the report in LaTeX and creates a PDF file. 
+    Writes the report in LaTeX and creates a PDF file (see latex_builder.py).
+    The figures are taken from figures (rendered into memory with DataVisualizer.render_all), which
+    are written next to the LaTeX source into the fig/ directory inside output_dir, or, if figures
+    is None, expected there. Their format is get_fig_format(doc_config).
+    If doc_config["backend"] is "html", a single HTML file is written instead (see html_builder.py).
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Arguments:
     df: pd.DataFrame; cleaned dataframe used for report.
     stats_dict: dict; as extracted in StatsExtractor.
     doc_config: dict extracted from doc_config.json
+    output_dir: str; directory to write the report to
+    figures: dict or None; name of the figure -> bytes
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Returns:
     None
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     """
+    get_fig_format(doc_config) # validates backend and figure format before anything is written
 
-    # Initialize doc
-    doc = Document(doc_config["doc_name"], geometry_options=doc_config["geometry_options"])
-
-    # Write title page
-    doc.preamble.append(Command("title",doc_config["title"]))
-    doc.preamble.append(Command("author", doc_config["author"]))
-    doc.preamble.append(Command("date", NoEscape(r"\today")))
-    doc.append(NoEscape(r"\maketitle"))
-
-    with doc.create(Tabular("l l")) as table:
-        table.add_row(["Work Group:", df['Account'].values[0]])
-        table.add_row(["Time Frame:", f"{df['PeriodStartDate'].values[0]} - {df['PeriodEndDate'].values[0]}"])
-
-    doc.append(NoEscape(r"\tableofcontents"))
-
-    ## BASIC STATS ##
-    doc.append(NoEscape(r"\pagebreak"))
-    with doc.create(Section("Basic Stats")):
-
-        with doc.create(Subsection("Full Sample")):
-
-            data = stats_dict["full"]["basic_stats"]
-            
-            doc.append(
-                f"In the given time frame, {data['n_start']} tasks were started \
-                and {data['n_end']} ended. {data['n_start_end']} \
-                ({round(data['n_start_end'] / (data['n_end']+data['n_start']-data['n_start_end'])*100,2)} %) \
-                of them started and ended within the given time frame. \
-                Sections 2 and 3 will only consider those tasks which started and ended within the given time frame."
-            )
-
-            with doc.create(Figure(position="h!")) as fig:
-                fig.add_image("fig/basic_stats_full.jpg", width="250px")
-                fig.add_caption("Number of started and ended tasks.")
-
-        if "user_split" in stats_dict.keys():
-            with doc.create(Subsection("User Split")):
-                
-                user_names = stats_dict["user_split"]["user_names"]
-                user_counts = stats_dict["user_split"]["user_counts"]
-                n_over_ten_jobs = sum([1 for x in user_counts if x >=10])
-                data = stats_dict["user_split"]["basic_stats"]
-
-                doc.append(
-                    f"The number of tasks (started and ended) ranged from \
-                    {data['n_start_end'][0]} by {user_names[0]} to \
-                    {data['n_start_end'][-1]} by {user_names[-1]}. "
-                )
-
-                doc.append(
-                    f"A total of {n_over_ten_jobs} user(s) started and ended at least 10 tasks. \
-                    Only for those users, boxplots are computed in Section 3."
-                )
-
-                with doc.create(Figure(position="h!")) as fig:
-                    fig.add_image("fig/basic_stats_user_split.jpg", width="275px")
-                    fig.add_caption("Number of started and ended tasks by different users.")  
-
-        if "partition_split" in stats_dict.keys():
-            with doc.create(Subsection("Partition Split")):
-
-                partition_names = stats_dict["partition_split"]["partition_names"]
-                partition_counts = stats_dict["partition_split"]["partition_counts"]
-                n_over_ten_jobs = sum([1 for x in partition_counts if x >=10])
-                data = stats_dict["partition_split"]["basic_stats"]
-
-                doc.append(
-                    f"The number of tasks (started and ended) ranged from \
-                    {data['n_start_end'][0]} on the {partition_names[0]} partiton to \
-                    {data['n_start_end'][-1]} on {partition_names[-1]}. "
-                )
-
-                doc.append(
-                    f"A total of {n_over_ten_jobs} partition(s) were used to complete (start and end) \
-                    at least 10 tasks. Only for those partitions, boxplots are computed in Section 3."
-                )
-
-                data = stats_dict["partition_split"]["basic_stats"]
-
-                with doc.create(Figure(position="h!")) as fig:
-                    fig.add_image("fig/basic_stats_partition_split.jpg", width="275px")
-                    fig.add_caption("Number of started and ended tasks on different partitions.")  
-
-    ## TASK METRICS ##
-
-    doc.append(NoEscape(r"\pagebreak"))
-    with doc.create(Section("Task Metrics")):
-
-        with doc.create(Subsection("Full Sample")):
-            
-            data = stats_dict["full"]["task_metrics"]
-
-            doc.append(
-                f"In the full sample, the task durations ranged from \
-                {round(data['ElapsedRaw'][0]/60)} to {round(data['ElapsedRaw'][-2]/60)} minutes \
-                (M = {round(data['ElapsedRaw'][-1]/60)} min). "
-            )
-        
-            doc.append(
-                f"The number of allocated CPUs ranged from \
-                {round(data['AllocCPUS'][0])} to {round(data['AllocCPUS'][-2])} \
-                (M = {round(data['AllocCPUS'][-1])}). "
-            )
-
-            doc.append(
-                f"Finally, the CPU Time (task duration * allocated CPUs) ranged from \
-                {round(data['CPUTimeRaw'][0]/60)} to {round(data['CPUTimeRaw'][-2]/60)} minutes \
-                (M = {round(data['CPUTimeRaw'][-1]/60)} min). \n"
-            )
-
-            # Prepare data for table
-            data_array = np.zeros((8,3))
-            for i, k in enumerate(data.keys()):
-                data_array[:,i] = data[k]
-            data_array[:,1] /= 60
-            data_array[:,2] /= 60
-            data_array = np.round(data_array).astype(int)
-            
-            # Build table
-            with doc.create(Table(position="h!")) as t:
-                build_table(doc=doc, data=data_array, col_names=["Allocated CPUs", "Task Duration (min)", "CPU Time"],
-                            position_codes="c c c", index=["min", "5quant", "25quant", "median", "75quant", "95quant", "max", "mean"])
-                t.add_caption("Task metrics for the full sample.")
-                #Label()
-            
-            # Display plot
-            with doc.create(Figure(position="h!")) as fig:
-                fig.add_image("fig/task_metrics_full.jpg", width="400px")
-                fig.add_caption("Distributions of task duration, allocated CPUs, and CPU time. Whiskers indicate the 5th and 95th percentiles.")  
-        
-        doc.append(NoEscape(r"\pagebreak"))
-        if "user_split" in stats_dict.keys():
-            with doc.create(Subsection("User Split")):
-
-                data = stats_dict["user_split"]["task_metrics"]
-
-                # Some text?
-                doc.append("Below, you can find the distributions of the task metrics for each user. In the table, all users are listed. Boxplots are only generated for users with at least 10 tasks.\n")
-
-                # Prepare data for table
-                data_array = np.zeros((len(user_names),4), dtype=tuple)
-                data_array[:,0] = user_counts
-                for user_idx in range(len(user_names)):
-                    for metric_idx, metric in enumerate(data.keys()):
-                        metric_vals = data[metric][user_idx]
-                        if metric_idx == 0:
-                            data_array[user_idx,metric_idx+1] = (round(metric_vals[0]), round(metric_vals[-1]), round(metric_vals[-2]))
-                        else:
-                            data_array[user_idx,metric_idx+1] = (round(metric_vals[0]/60), round(metric_vals[-1]/60), round(metric_vals[-2]/60))
-                #print(data_array)
-                
-                # Build table
-                with doc.create(Table(position="h!")) as t:
-                    build_table(doc=doc, data=data_array, col_names=["Num Tasks", "Allocated CPUs", "Task Duration", "CPU Time"],
-                                position_codes="l c c c", index=user_names)
-                    t.add_caption("Task metrics for different users. Values in parantheses indicate (min, mean, max). Time is measured in seconds.")
-
-                # Show plot ( if any user has at least 10 tasks )
-                if any([count>=10 for count in user_counts]):
-                    with doc.create(Figure(position="h!")) as fig:
-                        fig.add_image("fig/task_metrics_user_split.jpg", width="350px")
-                        fig.add_caption("Distributions of task duration, allocated CPUs, and CPU time for different users. Whiskers indicate the 5th and 95th percentiles.") 
-
-            doc.append(NoEscape(r"\pagebreak"))
-        if "partition_split" in stats_dict.keys():
-            with doc.create(Subsection("Partition Split")):
-
-                data = stats_dict["partition_split"]["task_metrics"]
-
-                # Some text?
-                doc.append("Below, you can find the distributions of the task metrics for each partition. In the table, all partitions are listed. Boxplots are only generated for partitions with at least 10 tasks.\n")
-
-                # Prepare data for table
-                data_array = np.zeros((len(partition_names),4), dtype=tuple)
-                data_array[:,0] = partition_counts
-                for partition_idx in range(len(partition_names)):
-                    for metric_idx, metric in enumerate(data.keys()):
-                        metric_vals = data[metric][partition_idx]
-                        if metric_idx == 0:
-                            data_array[partition_idx,metric_idx+1] = (round(metric_vals[0]), round(metric_vals[-1]), round(metric_vals[-2]))
-                        else:
-                            data_array[partition_idx,metric_idx+1] = (round(metric_vals[0]/60), round(metric_vals[-1]/60), round(metric_vals[-2]/60))
-
-                #print(data_array)
-                
-                # Build table
-                with doc.create(Table(position="h!")) as t:
-                    build_table(doc=doc, data=data_array, col_names=["Num Tasks", "Allocated CPUs", "Task Duration", "CPU Time"],
-                                position_codes="l c c c", index=partition_names)
-                    t.add_caption("Task metrics for different partitions. Values in parantheses indicate (min, mean, max). Time is measured in seconds.")
-
-                # Show plot ( if any partition has at least 10 tasks )
-                if any([count>=10 for count in partition_counts]):
-                    with doc.create(Figure(position="h!")) as fig:
-                        fig.add_image("fig/task_metrics_partition_split.jpg", width="350px")
-                        fig.add_caption("Distributions of task duration, allocated CPUs, and CPU time for different partitions. Whiskers indicate the 5th and 95th percentiles.") 
-
-
-    ## TERMINATION STATS ##
-    doc.append(NoEscape(r"\pagebreak"))
-    with doc.create(Section("Termination Stats")):
-        
-        # Prepare data
-        data = stats_dict["full"]["termination_stats"]
-
-        # Write text
-        doc.append(
-            f"From the {sum(data.values())} tasks that started and ended in the given time frame,\
-            {data['n_complete']} were completed successfully,\
-            {data['n_cancelled']} were actively cancelled,\
-            {data['n_timeout']} were ended due to a timeout,\
-            and {data['n_failed']} failed for other reasons."
-            )
-        
-        # Add figure
-        with doc.create(Figure(position="h!")) as fig:
-            fig.add_image("fig/termination_stats_full.jpg", width="300px")
-            fig.add_caption("Termination stats for the full sample.")
+    if doc_config.get("backend", "latex") == "html":
+        from html_builder import build_html_document
+        build_html_document(df, stats_dict, doc_config, output_dir=output_dir, figures=figures)
+        return
 
-    # Export pdf
-    doc.generate_pdf(clean_tex=False)
+    from latex_builder import build_latex_document # pylatex is only needed for this backend
+    build_latex_document(df, stats_dict, doc_config, output_dir=output_dir, figures=figures)
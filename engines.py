@@ -0,0 +1,67 @@
+"""
+Engines which load and clean the dataset and extract the stats_dict.
+The engine is selected by name (ENGINE in main.py):
+    * "pandas": data_loader, data_cleaner and StatsExtractor; the reference implementation
+    * "pyarrow": PyArrow csv reader and compute kernels (multithreaded, see arrow_engine.py)
+All engines return the same stats_dict. Every engine provides:
+    * load_dataset(dataset_path, account, period_start_date, period_end_date): cleaned dataset
+      in the engine's format
+    * stats_extractor(cleaned_dataset): StatsExtractor (or subclass) for the cleaned dataset
+    * to_pandas(cleaned_dataset): the dataframe returned by data_cleaner, e.g. for the document
+    * memory_per_row(cleaned_dataset): bytes per row of the cleaned dataset
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: name of the engine
+OUT: engine
+"""
+
+import pandas as pd
+
+from data_cleaner import memory_per_row
+from data_loader import load_dataset, CHUNK_SIZE
+from stats_extractor import StatsExtractor
+
+ENGINES = ["pandas", "pyarrow"]
+
+
+class PandasEngine:
+
+
+    def __init__(self, chunksize: int=CHUNK_SIZE):
+        self.chunksize = chunksize
+
+
+    def load_dataset(self, dataset_path: str, account: str, period_start_date: str, period_end_date: str) -> pd.DataFrame:
+        return load_dataset(dataset_path, account=account, period_start_date=period_start_date,
+                            period_end_date=period_end_date, chunksize=self.chunksize)
+
+
+    def stats_extractor(self, cleaned_dataset: pd.DataFrame) -> StatsExtractor:
+        return StatsExtractor(cleaned_dataset)
+
+
+    def to_pandas(self, cleaned_dataset: pd.DataFrame) -> pd.DataFrame:
+        return cleaned_dataset
+
+
+    def memory_per_row(self, cleaned_dataset: pd.DataFrame) -> float:
+        return memory_per_row(cleaned_dataset)
+
+
+def get_engine(name: str, chunksize: int=CHUNK_SIZE):
+    """
+    Returns the engine with the given name.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    name: str in ENGINES
+    chunksize: int; number of rows read at once while streaming the dataset
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    engine
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if name == "pandas":
+        return PandasEngine(chunksize)
+    if name == "pyarrow":
+        from arrow_engine import ArrowEngine # pyarrow is only needed for this engine
+        return ArrowEngine(chunksize)
+    raise ValueError(f"Unknown engine '{name}', please choose one of {ENGINES}.")
@@ -0,0 +1,114 @@
+"""
+Content-addressed cache of rendered figures.
+A figure is identified by the hash of everything it is rendered from (plot method, arguments,
+stats_dict slice, plot_config entries). If a report is re-issued with unchanged numbers, e.g.
+with only a new title, the figures are read from the cache instead of being rendered again.
+The size of the cache is bounded; the least recently used figures are evicted first.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: figure content (any JSON-like object) and rendered figures (bytes)
+OUT: cached figures (bytes)
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from stats_extractor import to_json_types
+
+
+def _hash_default(obj):
+    """
+    Converts objects which are not JSON serializable (e.g. colormaps) for hashing.
+    """
+    if callable(obj) and hasattr(obj, "N"): # matplotlib colormap: hash its colors
+        return np.asarray(obj(np.linspace(0, 1, obj.N))).round(6).tolist()
+    return repr(obj)
+
+
+def content_hash(content) -> str:
+    """
+    Computes a stable hash of a JSON-like object (dicts are hashed independently of key order).
+    """
+    content_json = json.dumps(to_json_types(content), sort_keys=True, default=_hash_default)
+    return hashlib.sha256(content_json.encode()).hexdigest()
+
+
+class FigureCache:
+
+
+    def __init__(self, cache_dir: str=".fig_cache", max_bytes: int=200_000_000):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, key + extension)
+
+
+    def get_bytes(self, key: str, extension: str):
+        """
+        Returns the cached figure with the given key as bytes, or None if it is not cached.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        key: str; hash of the figure content
+        extension: str; file ending of the figure format, e.g. ".pdf"
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        bytes or None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        cached_path = self._path(key, extension)
+        try:
+            with open(cached_path, "rb") as file:
+                figure = file.read()
+            os.utime(cached_path) # mark as recently used
+        except FileNotFoundError:
+            return None
+        return figure
+
+
+    def put_bytes(self, key: str, extension: str, figure: bytes):
+        """
+        Adds a figure rendered into memory to the cache and evicts the least recently used figures
+        if the cache exceeds max_bytes.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        key: str; hash of the figure content
+        extension: str; file ending of the figure format, e.g. ".pdf"
+        figure: bytes; rendered figure
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        cached_path = self._path(key, extension)
+        # Write to a temporary file first, so concurrent processes never read a partial figure
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(figure)
+        os.replace(tmp_path, cached_path)
+        self.evict()
+
+
+    def evict(self):
+        """
+        Deletes the least recently used figures until the cache fits into max_bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError: # already evicted by another process
+                pass
+            total_bytes -= size
@@ -0,0 +1,159 @@
+"""
+Follow mode: keeps the stats of accounts up to date while the dataset is growing.
+A StatsFollower polls the dataset and adds only the newly appended lines to an AggregateStore
+(which remembers the byte offset it has read up to), so the dataset is never rescanned. The current
+stats_dict of any account and period is built on demand from the aggregates (AggregateStatsExtractor),
+i.e. its cost does not depend on the size of the dataset. Polling can run in a background thread,
+e.g. next to a dashboard which calls get_stats().
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: path to growing csv file (dump of the database)
+OUT: stats_dict for any account and period
+
+Usage:
+python follow.py <dataset_path> <account> <period_start_date> <period_end_date> [--interval SECONDS] [--store PATH]
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from aggregate_store import AggregateStore, AggregateStatsExtractor
+from data_loader import CHUNK_SIZE
+
+POLL_INTERVAL = 5 # seconds between two polls of the dataset
+
+
+class StatsFollower:
+
+
+    def __init__(self, dataset_path: str, store_path: str=None, poll_interval: float=POLL_INTERVAL,
+                 chunksize: int=CHUNK_SIZE):
+        self.dataset_path = dataset_path
+        # Continue from a saved store, so a restart does not reread the dataset
+        self.store = AggregateStore.open(store_path) if store_path else AggregateStore()
+        self.poll_interval = poll_interval
+        self.chunksize = chunksize
+        self.version = 0 # increased whenever new rows were added
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats_cache = {} # (account, period_start_date, period_end_date) -> (version, stats_dict)
+
+
+    def poll(self) -> int:
+        """
+        Adds the lines appended to the dataset since the last poll.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        int; number of new rows
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if not os.path.isfile(self.dataset_path):
+            return 0
+        with self._lock:
+            n_rows = self.store.update(self.dataset_path, chunksize=self.chunksize)
+            if n_rows:
+                self.version += 1
+        return n_rows
+
+
+    def get_stats(self, account: str, period_start_date: str, period_end_date: str):
+        """
+        Returns the current stats_dict of an account and period (see AggregateStatsExtractor).
+        The stats_dict is rebuilt only if rows were added since it was last requested.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        account: str
+        period_start_date: str; format='yyyy-mm-dd'
+        period_end_date: str; format='yyyy-mm-dd'
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        dict or None if there are no tasks
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        cache_key = (account, period_start_date, period_end_date)
+        with self._lock:
+            version, stats_dict = self._stats_cache.get(cache_key, (None, None))
+            if version != self.version:
+                try:
+                    stats_dict = AggregateStatsExtractor(self.store, account, period_start_date, period_end_date).extract_stats()
+                except ValueError:
+                    stats_dict = None
+                self._stats_cache[cache_key] = (self.version, stats_dict)
+        return stats_dict
+
+
+    def run(self, callback=None):
+        """
+        Polls the dataset every poll_interval seconds until stop() is called.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        callback: function or None; called with the number of new rows after every poll which added rows
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        try:
+            while not self._stop_event.is_set():
+                n_rows = self.poll()
+                if n_rows and callback is not None:
+                    callback(n_rows)
+                self._stop_event.wait(self.poll_interval)
+        finally:
+            self.save()
+
+
+    def start(self, callback=None):
+        """
+        Runs the polling loop in a background thread.
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, args=(callback,), daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Stops the polling loop (and waits for the background thread).
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def save(self):
+        """
+        Saves the store if it has a path.
+        """
+        if self.store.path:
+            with self._lock:
+                self.store.save()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the stats of an account up to date while the dataset grows.")
+    parser.add_argument("dataset_path")
+    parser.add_argument("account")
+    parser.add_argument("period_start_date")
+    parser.add_argument("period_end_date")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between two polls")
+    parser.add_argument("--store", default=None, help="directory to save the aggregate store to, e.g. for restarts")
+    args = parser.parse_args()
+
+    follower = StatsFollower(args.dataset_path, store_path=args.store, poll_interval=args.interval)
+
+    def print_stats(n_rows):
+        stats_dict = follower.get_stats(args.account, args.period_start_date, args.period_end_date)
+        if stats_dict is None:
+            print(f"{time.strftime('%H:%M:%S')} +{n_rows} rows; no tasks for this account in the given time frame")
+            return
+        counts = {**stats_dict["full"]["basic_stats"], **stats_dict["full"]["termination_stats"]}
+        print(f"{time.strftime('%H:%M:%S')} +{n_rows} rows; " + ", ".join(f"{key}: {int(value)}" for key, value in counts.items()))
+
+    try:
+        follower.run(callback=print_stats)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,322 @@
+"""
+HTML backend of the report (doc_config["backend"] = "html").
+Writes the sections of the LaTeX report (see latex_builder.py) into a single self-contained HTML
+file: the figures are inlined (as SVG by default, i.e. vector graphics; no image files needed) and
+the tables are written as HTML tables. No LaTeX toolchain is needed, so the report is ready as soon as the figures are.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: cleaned dataframe, stats_dict, doc_config, figures (in memory or in fig/)
+OUT: <doc_name>.html
+"""
+
+import base64
+import datetime
+import html
+import os
+
+import numpy as np
+import pandas as pd
+
+from document_builder import get_fig_format, core_utilization_text
+
+STYLE = """
+body { font-family: Georgia, serif; max-width: 800px; margin: 2em auto; padding: 0 1em; line-height: 1.4; }
+h1, .author, .date { text-align: center; }
+table { border-collapse: collapse; margin: 1em auto; }
+th, td { padding: 0.2em 0.8em; text-align: center; }
+th { border-bottom: 1px solid black; }
+td:first-child, th:first-child { text-align: left; }
+table.data tr:last-child td { border-bottom: 1px solid black; }
+table.data td.index { border-right: 1px solid black; }
+table.header td { text-align: left; }
+figure { margin: 1.5em auto; text-align: center; }
+figure svg { width: 100%; height: auto; }
+figcaption, caption { font-size: 0.9em; margin: 0.5em; }
+"""
+
+
+def build_html_table(data: np.ndarray, col_names: list=None, index: list=None, caption: str=None) -> str:
+    """
+    Writes a table based on a data array, like latex_builder.build_table.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    data: 2D np.ndarray; data to include in table.
+    col_names: list of strings.
+    index: list of strings.
+    caption: str or None.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    str; html table
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    m, n = data.shape
+
+    # Check if col_names and index have correct dimension
+    if not col_names or len(col_names) != n:
+        col_names = [f"col{i}" for i in range(n)]
+    if index and len(index) != m:
+        index = None
+
+    rows = []
+    if caption:
+        rows.append(f"<caption>{html.escape(caption)}</caption>")
+    header = ([""] if index else []) + col_names
+    rows.append("<tr>" + "".join(f"<th>{html.escape(str(name))}</th>" for name in header) + "</tr>")
+    for i in range(m):
+        cells = "".join(f"<td>{html.escape(str(value))}</td>" for value in data[i,:])
+        if index:
+            cells = f'<td class="index">{html.escape(str(index[i]))}</td>' + cells
+        rows.append(f"<tr>{cells}</tr>")
+    return '<table class="data">\n' + "\n".join(rows) + "\n</table>"
+
+
+def inline_figure(figure: bytes, fig_format: str) -> str:
+    """
+    Returns the figure as inline element: SVG as <svg> element (without XML declaration and doctype),
+    raster images as <img> with a data URI.
+    """
+    if fig_format == "svg":
+        svg = figure.decode()
+        return svg[svg.index("<svg"):]
+    mime_type = "image/jpeg" if fig_format == "jpg" else f"image/{fig_format}"
+    return f'<img src="data:{mime_type};base64,{base64.b64encode(figure).decode()}">'
+
+
+class HtmlReport:
+    """
+    Collects the parts of the report; sections and figures are numbered as in the LaTeX report.
+    """
+
+
+    def __init__(self, fig_dir: str, fig_format: str, figures: dict=None):
+        self.fig_dir = fig_dir
+        self.fig_format = fig_format
+        self.figures = figures # name -> bytes; if None, the figures are read from fig_dir
+        self.parts = []
+        self.sections = [] # (anchor, title) for the table of contents
+        self.labels = {} # label -> number of the section, for references
+        self.n_subsections = 0
+        self.n_figures = 0
+        self.n_tables = 0
+
+
+    def section(self, title: str, label: str=None):
+        anchor = f"section-{len(self.sections) + 1}"
+        self.sections.append((anchor, title))
+        if label is not None:
+            self.labels[label] = len(self.sections)
+        self.n_subsections = 0
+        self.parts.append(f'<h2 id="{anchor}">{len(self.sections)} {html.escape(title)}</h2>')
+
+
+    def subsection(self, title: str):
+        self.n_subsections += 1
+        self.parts.append(f"<h3>{len(self.sections)}.{self.n_subsections} {html.escape(title)}</h3>")
+
+
+    def ref(self, label: str) -> str:
+        return str(self.labels[label])
+
+
+    def text(self, text: str):
+        # Collapse the whitespace of the line continuations in the texts
+        self.parts.append(f"<p>{html.escape(' '.join(text.split()))}</p>")
+
+
+    def figure(self, name: str, width: str, caption: str):
+        self.n_figures += 1
+        if self.figures is not None:
+            figure = self.figures[name]
+        else:
+            with open(os.path.join(self.fig_dir, f"{name}.{self.fig_format}"), "rb") as file:
+                figure = file.read()
+        self.parts.append(f'<figure style="width: {width}">{inline_figure(figure, self.fig_format)}<figcaption>Figure {self.n_figures}: '
+                          f'{html.escape(caption)}</figcaption></figure>')
+
+
+    def table(self, data: np.ndarray, col_names: list, index: list, caption: str):
+        self.n_tables += 1
+        self.parts.append(build_html_table(data, col_names=col_names, index=index,
+                                           caption=f"Table {self.n_tables}: {caption}"))
+
+
+def build_html_document(df: pd.DataFrame, stats_dict: dict, doc_config: dict, output_dir: str=".", figures: dict=None):
+    """
+    Writes the report as a single HTML file with inline figures (SVG by default, see document_builder.get_fig_format).
+    The figures are taken from figures (rendered into memory with DataVisualizer.render_all), or,
+    if figures is None, read from the fig/ directory inside output_dir.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    df: pd.DataFrame; cleaned dataframe used for report.
+    stats_dict: dict; as extracted in StatsExtractor.
+    doc_config: dict extracted from doc_config.json
+    output_dir: str; directory to write the report to
+    figures: dict or None; name of the figure -> bytes
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    str; path of the HTML file
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    report = HtmlReport(os.path.join(output_dir, "fig"), get_fig_format(doc_config), figures)
+
+    ## BASIC STATS ##
+    report.section("Basic Stats")
+
+    report.subsection("Full Sample")
+    data = stats_dict["full"]["basic_stats"]
+    report.text(
+        f"In the given time frame, {data['n_start']} tasks were started \
+        and {data['n_end']} ended. {data['n_start_end']} \
+        ({round(data['n_start_end'] / (data['n_end']+data['n_start']-data['n_start_end'])*100,2)} %) \
+        of them started and ended within the given time frame. \
+        Sections 2 and 3 will only consider those tasks which started and ended within the given time frame."
+    )
+    report.figure("basic_stats_full", "250px", "Number of started and ended tasks.")
+
+    if "user_split" in stats_dict.keys():
+        report.subsection("User Split")
+        user_names = stats_dict["user_split"]["user_names"]
+        user_counts = stats_dict["user_split"]["user_counts"]
+        n_over_ten_jobs = sum([1 for x in user_counts if x >=10])
+        data = stats_dict["user_split"]["basic_stats"]
+        report.text(
+            f"The number of tasks (started and ended) ranged from \
+            {data['n_start_end'][0]} by {user_names[0]} to \
+            {data['n_start_end'][-1]} by {user_names[-1]}. \
+            A total of {n_over_ten_jobs} user(s) started and ended at least 10 tasks. \
+            Only for those users, boxplots are computed in Section 3."
+        )
+        report.figure("basic_stats_user_split", "275px", "Number of started and ended tasks by different users.")
+
+    if "partition_split" in stats_dict.keys():
+        report.subsection("Partition Split")
+        partition_names = stats_dict["partition_split"]["partition_names"]
+        partition_counts = stats_dict["partition_split"]["partition_counts"]
+        n_over_ten_jobs = sum([1 for x in partition_counts if x >=10])
+        data = stats_dict["partition_split"]["basic_stats"]
+        report.text(
+            f"The number of tasks (started and ended) ranged from \
+            {data['n_start_end'][0]} on the {partition_names[0]} partiton to \
+            {data['n_start_end'][-1]} on {partition_names[-1]}. \
+            A total of {n_over_ten_jobs} partition(s) were used to complete (start and end) \
+            at least 10 tasks. Only for those partitions, boxplots are computed in Section 3."
+        )
+        report.figure("basic_stats_partition_split", "275px", "Number of started and ended tasks on different partitions.")
+
+    ## TASK METRICS ##
+    report.section("Task Metrics", label="task_metrics")
+
+    report.subsection("Full Sample")
+    data = stats_dict["full"]["task_metrics"]
+    report.text(
+        f"In the full sample, the task durations ranged from \
+        {round(data['ElapsedRaw'][0]/60)} to {round(data['ElapsedRaw'][-2]/60)} minutes \
+        (M = {round(data['ElapsedRaw'][-1]/60)} min). \
+        The number of allocated CPUs ranged from \
+        {round(data['AllocCPUS'][0])} to {round(data['AllocCPUS'][-2])} \
+        (M = {round(data['AllocCPUS'][-1])}). \
+        Finally, the CPU Time (task duration * allocated CPUs) ranged from \
+        {round(data['CPUTimeRaw'][0]/60)} to {round(data['CPUTimeRaw'][-2]/60)} minutes \
+        (M = {round(data['CPUTimeRaw'][-1]/60)} min)."
+    )
+
+    # Prepare data for table
+    data_array = np.zeros((8,3))
+    for i, k in enumerate(data.keys()):
+        data_array[:,i] = data[k]
+    data_array[:,1] /= 60
+    data_array[:,2] /= 60
+    data_array = np.round(data_array).astype(int)
+    report.table(data_array, ["Allocated CPUs", "Task Duration (min)", "CPU Time"],
+                 ["min", "5quant", "25quant", "median", "75quant", "95quant", "max", "mean"],
+                 "Task metrics for the full sample.")
+    report.figure("task_metrics_full", "400px", "Distributions of task duration, allocated CPUs, and CPU time. Whiskers indicate the 5th and 95th percentiles.")
+
+    for split, names, counts, name in [("user_split", "user_names", "user_counts", "user"),
+                                       ("partition_split", "partition_names", "partition_counts", "partition")]:
+        if split not in stats_dict.keys():
+            continue
+        report.subsection(f"{name.capitalize()} Split")
+        split_names = stats_dict[split][names]
+        split_counts = stats_dict[split][counts]
+        data = stats_dict[split]["task_metrics"]
+        report.text(
+            f"Below, you can find the distributions of the task metrics for each {name}. In the table, all {name}s are listed. \
+            Boxplots are only generated for {name}s with at least 10 tasks."
+        )
+
+        # Prepare data for table
+        data_array = np.zeros((len(split_names),4), dtype=tuple)
+        data_array[:,0] = split_counts
+        for split_idx in range(len(split_names)):
+            for metric_idx, metric in enumerate(data.keys()):
+                metric_vals = data[metric][split_idx]
+                if metric_idx == 0:
+                    data_array[split_idx,metric_idx+1] = (round(metric_vals[0]), round(metric_vals[-1]), round(metric_vals[-2]))
+                else:
+                    data_array[split_idx,metric_idx+1] = (round(metric_vals[0]/60), round(metric_vals[-1]/60), round(metric_vals[-2]/60))
+        report.table(data_array, ["Num Tasks", "Allocated CPUs", "Task Duration", "CPU Time"], split_names,
+                     f"Task metrics for different {name}s. Values in parantheses indicate (min, mean, max). Time is measured in seconds.")
+
+        # Show plot ( if any user/partition has at least 10 tasks )
+        if any([count>=10 for count in split_counts]):
+            report.figure(f"task_metrics_{split}", "350px", f"Distributions of task duration, allocated CPUs, and CPU time for different {name}s. Whiskers indicate the 5th and 95th percentiles.")
+
+    ## TERMINATION STATS ##
+    report.section("Termination Stats", label="termination_stats")
+    data = stats_dict["full"]["termination_stats"]
+    report.text(
+        f"From the {sum(data.values())} tasks that started and ended in the given time frame,\
+        {data['n_complete']} were completed successfully,\
+        {data['n_cancelled']} were actively cancelled,\
+        {data['n_timeout']} were ended due to a timeout,\
+        and {data['n_failed']} failed for other reasons."
+    )
+    report.figure("termination_stats_full", "300px", "Termination stats for the full sample.")
+
+    ## CORE UTILIZATION ##
+    if "core_utilization" in stats_dict["full"].keys():
+        report.section("Core Utilization")
+        data = stats_dict["full"]["core_utilization"]
+        report.text(core_utilization_text(data, report.ref("task_metrics"), report.ref("termination_stats")))
+        report.figure("core_utilization_full", "400px", f"Allocated CPUs over time (mean and maximum per {data['bin_hours']} hour(s)).")
+
+        if "prorated_cpu_time" in stats_dict["full"].keys():
+            report.text(
+                f"Within the given time frame, the tasks used {round(stats_dict['full']['prorated_cpu_time'] / 3600)} CPU hours. \
+                Tasks which crossed the boundaries of the time frame are only counted with the part of their run time \
+                inside of it (run time times allocated CPUs)."
+            )
+            for split, names, name in [("user_split", "user_names", "User"), ("partition_split", "partition_names", "Partition")]:
+                if split in stats_dict.keys() and "prorated_cpu_time" in stats_dict[split].keys():
+                    data_array = np.array([[round(cpu_time / 3600)] for cpu_time in stats_dict[split]["prorated_cpu_time"]])
+                    report.table(data_array, ["CPU Hours"], stats_dict[split][names],
+                                 f"CPU hours within the given time frame per {name.lower()}.")
+
+    # Title, header table and table of contents
+    title = html.escape(doc_config["title"])
+    contents = "\n".join(f'<li><a href="#{anchor}">{html.escape(section_title)}</a></li>' for anchor, section_title in report.sections)
+    head = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>{STYLE}</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p class="author">{html.escape(doc_config["author"])}</p>
+<p class="date">{datetime.date.today().strftime("%B %d, %Y")}</p>
+<table class="header">
+<tr><td>Work Group:</td><td>{html.escape(str(df['Account'].values[0]))}</td></tr>
+<tr><td>Time Frame:</td><td>{html.escape(f"{df['PeriodStartDate'].values[0]} - {df['PeriodEndDate'].values[0]}")}</td></tr>
+</table>
+<h2>Contents</h2>
+<ol>
+{contents}
+</ol>
+"""
+
+    filepath = os.path.join(output_dir, doc_config["doc_name"] + ".html")
+    with open(filepath, "w") as file:
+        file.write(head + "\n".join(report.parts) + "\n</body>\n</html>\n")
+    return filepath
@@ -0,0 +1,154 @@
+"""
+Instrumentation of the report pipeline.
+A RunProfile records wall time, CPU time, peak RSS and row counts of every stage of a run and of
+the sub-steps of data_cleaner and StatsExtractor. Stages can optionally be wrapped in cProfile.
+The profile is written as JSON, e.g. next to the report.
+Sub-steps are recorded with run_step(), which only calls the function if no profile is active, so
+the modules of the pipeline do not depend on whether they are profiled. Steps which are executed
+several times (e.g. data_cleaner once per chunk) are summed up.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Usage:
+with RunProfile() as profile:
+    with profile.stage("load") as record:
+        dataset = load(...)
+        record["rows"] = len(dataset)
+    ...
+profile.save("my_report_profile.json")
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+_active_profile = None
+
+CLEAR_REFS_PATH = "/proc/self/clear_refs"
+STATUS_PATH = "/proc/self/status"
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak RSS of the process (Linux only). Returns False if not supported.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_mb() -> float:
+    """
+    Returns the peak RSS of the process in MB since the last reset (Linux),
+    or since the start of the process (other platforms).
+    """
+    try:
+        with open(STATUS_PATH, "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    # ru_maxrss is given in bytes on macOS and in KiB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
+
+
+class RunProfile:
+
+
+    def __init__(self, cprofile_stages: list=None, cprofile_dir: str="."):
+        self.cprofile_stages = cprofile_stages or [] # names of stages to wrap in cProfile
+        self.cprofile_dir = cprofile_dir
+        self.records = {} # stage path -> record
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self._stack = []
+
+
+    def __enter__(self):
+        global _active_profile
+        self._previous_profile = _active_profile
+        _active_profile = self
+        return self
+
+
+    def __exit__(self, *exc_info):
+        global _active_profile
+        _active_profile = self._previous_profile
+
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Measures the enclosed code as stage (or as sub-step of the enclosing stage).
+        Yields the stage's record, in which e.g. "rows" can be set.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        name: str; name of the stage
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Yields:
+        dict; record of the stage
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        path = "/".join([record["stage"] for record in self._stack] + [name])
+        record = self.records.setdefault(path, {"stage": path, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+        record["calls"] += 1
+        # The peak is reset for this stage, so the enclosing stage first takes over its peak so far
+        if self._stack:
+            self._stack[-1]["peak_rss_mb"] = max(self._stack[-1]["peak_rss_mb"], get_peak_rss_mb())
+        self._stack.append(record)
+
+        profiler = cProfile.Profile() if name in self.cprofile_stages else None
+        reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                record["cprofile"] = os.path.join(self.cprofile_dir, path.replace("/", "_") + ".prof")
+                profiler.dump_stats(record["cprofile"])
+            record["wall_s"] += time.perf_counter() - wall_start
+            record["cpu_s"] += time.process_time() - cpu_start
+            record["peak_rss_mb"] = max(record["peak_rss_mb"], get_peak_rss_mb())
+            self._stack.pop()
+            # The peak after the reset is part of the enclosing stage as well
+            if self._stack:
+                self._stack[-1]["peak_rss_mb"] = max(self._stack[-1]["peak_rss_mb"], record["peak_rss_mb"])
+
+
+    def to_dict(self) -> dict:
+        records = [dict(record, wall_s=round(record["wall_s"], 4), cpu_s=round(record["cpu_s"], 4),
+                        peak_rss_mb=round(record["peak_rss_mb"], 2)) for record in self.records.values()]
+        return {"started": self.started, "stages": records}
+
+
+    def save(self, path: str):
+        """
+        Writes the profile as JSON to path.
+        """
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+def run_step(name: str, function, *args, **kwargs):
+    """
+    Calls function(*args, **kwargs) and, if a RunProfile is active, records it as sub-step
+    of the current stage (with the number of rows of the result if it is a dataframe).
+    """
+    if _active_profile is None:
+        return function(*args, **kwargs)
+
+    with _active_profile.stage(name) as record:
+        result = function(*args, **kwargs)
+        if hasattr(result, "shape"):
+            record["rows"] = record.get("rows", 0) + result.shape[0]
+    return result
@@ -1,51 +1,253 @@
-from data_cleaner import data_cleaner
-from stats_extractor import StatsExtractor
-from data_visualizer import DataVisualizer
-from document_builder import build_document
-from plot_config import set_plot_config
+# matplotlib and pylatex are imported in the functions which create visualizations and documents,
+# so the stats-only mode does not pay for them
+from engines import get_engine
+from instrumentation import RunProfile
+from stats_extractor import stats_to_json
 
 import pandas as pd
-import numpy as np
 
+import contextlib
 import json
 import os
+import sys
 
 DATASET_PATH = "../dataset/slurmaccountdata/slurmaccountdata_shortened.csv"
 ACCOUNT_NAME = "627bc058-c28d-4680"
 START_DATE = "2021-08-01"
 END_DATE = "2021-08-31"
+CHUNK_SIZE = 500_000 # rows per chunk when streaming the dataset
+PARQUET_CACHE_PATH = None # e.g. "../dataset/slurmaccountdata/cache"; built with parquet_cache.py
+ENGINE = "pandas" # engine which loads, cleans and extracts stats: "pandas" (reference) or "pyarrow" (multithreaded)
+
+# Streaming ingest: the output of sacct is cleaned while sacct is running, instead of reading DATASET_PATH
+SACCT_COMMAND = None # e.g. sacct_stream.sacct_command(START_DATE, END_DATE, ACCOUNT_NAME), or "-" to read stdin
+
+# Batch mode: one report per account, written to BATCH_OUTPUT_DIR/<account>/
+BATCH_MODE = False
+BATCH_ACCOUNTS = None # list of account names, None for all accounts active in the time frame
+BATCH_OUTPUT_DIR = "reports"
+N_WORKERS = None # number of worker processes, None for the number of CPUs
+
+# Multi-period mode: one report per period (e.g. month) of START_DATE - END_DATE for ACCOUNT_NAME,
+# written to BATCH_OUTPUT_DIR/<period start>_<period end>/; the dataset is loaded and cleaned only once
+PERIOD_FREQ = None # e.g. "MS" (months) or "W-MON" (weeks starting on Monday)
+
+# Incremental mode: stats are extracted from a store of per-day aggregates, which is
+# updated with the rows appended to DATASET_PATH since the last run
+AGGREGATE_STORE_PATH = None # e.g. "aggregates" (directory)
+
+# Column store mode: stats are computed on the memory-mapped columns of a store built with column_store.py
+COLUMN_STORE_PATH = None # e.g. "../dataset/slurmaccountdata/columns"
+
+# Stats-only mode: the stats_dict is written as JSON to STATS_OUTPUT_PATH instead of building a report
+# (no visualizations and no document, matplotlib and pylatex are not imported)
+STATS_ONLY = False
+STATS_OUTPUT_PATH = "-" # path of the JSON file, "-" for stdout (progress messages then go to stderr)
+
+# Profiling: wall time, CPU time, peak RSS and rows per stage are written to <doc_name>_profile.json
+WRITE_PROFILE = True
+CPROFILE_STAGES = [] # stages additionally profiled with cProfile, e.g. ["stats"]; written to <stage>.prof
+
+
+def use_parquet_cache():
+    return PARQUET_CACHE_PATH and os.path.isdir(PARQUET_CACHE_PATH)
+
+
+def get_data_engine():
+    """
+    Returns the configured engine (the Parquet cache and the sacct stream are read into pandas,
+    so they use the pandas engine).
+    """
+    return get_engine("pandas" if use_parquet_cache() or SACCT_COMMAND else ENGINE, chunksize=CHUNK_SIZE)
+
+
+def load_cleaned_dataset(account, engine):
+    """
+    Loads the cleaned dataset for an account (or all accounts if account is None) from the output
+    of SACCT_COMMAND if set, from the Parquet cache if available, else by streaming the csv file with the engine.
+    """
+    if SACCT_COMMAND:
+        from sacct_stream import load_sacct_stream
+        return load_sacct_stream(SACCT_COMMAND, account, START_DATE, END_DATE, chunksize=CHUNK_SIZE)
+    if use_parquet_cache():
+        from parquet_cache import read_parquet_cache # pyarrow is only needed for the cache
+        return read_parquet_cache(PARQUET_CACHE_PATH, account=account, period_start_date=START_DATE,
+                                  period_end_date=END_DATE)
+    return engine.load_dataset(DATASET_PATH, account, START_DATE, END_DATE)
+
+
+def extract_stats_from_store():
+    """
+    Adds the rows appended to the dataset since the last run to the aggregate store
+    and extracts the stats_dict from the store. Returns None if there are no tasks.
+    """
+    from aggregate_store import AggregateStore, AggregateStatsExtractor
+
+    print("... updating aggregate store ... (1-2/5)")
+    store = AggregateStore.open(AGGREGATE_STORE_PATH)
+    store.update(DATASET_PATH, chunksize=CHUNK_SIZE)
+    store.save()
+
+    if not store.get_records(ACCOUNT_NAME, START_DATE, END_DATE):
+        print("No tasks for this account were recorded in the given time frame.")
+        return None
+
+    print("... extracting stats ... (3/5)")
+    return AggregateStatsExtractor(store, ACCOUNT_NAME, START_DATE, END_DATE).extract_stats()
+
+
+def extract_stats_from_column_store():
+    """
+    Extracts the stats_dict from the memory-mapped column store. Returns None if there are no tasks.
+    """
+    from column_store import ColumnStore, ColumnStatsExtractor
+
+    print("... opening column store ... (1-2/5)")
+    store = ColumnStore(COLUMN_STORE_PATH)
+
+    print("... extracting stats ... (3/5)")
+    try:
+        return ColumnStatsExtractor(store, ACCOUNT_NAME, START_DATE, END_DATE).extract_stats()
+    except ValueError as e:
+        print(e)
+        return None
+
+
+def main_stats():
+    """
+    Writes the stats_dict as JSON to STATS_OUTPUT_PATH (null if there are no tasks).
+    """
+    to_stdout = STATS_OUTPUT_PATH == "-"
+
+    # The JSON on stdout must not be mixed with the progress messages
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        if AGGREGATE_STORE_PATH:
+            stats_dict = extract_stats_from_store()
+        elif COLUMN_STORE_PATH:
+            stats_dict = extract_stats_from_column_store()
+        else:
+            print("... loading and cleaning dataset ... (1-2/3)")
+            engine = get_data_engine()
+            cleaned_dataset = load_cleaned_dataset(ACCOUNT_NAME, engine)
+            if len(cleaned_dataset) == 0:
+                print("No tasks for this account were recorded in the given time frame.")
+                stats_dict = None
+            else:
+                print("... extracting stats ... (3/3)")
+                stats_dict = engine.stats_extractor(cleaned_dataset).extract_stats()
+
+    stats_json = stats_to_json(stats_dict)
+    if to_stdout:
+        print(stats_json)
+    else:
+        with open(STATS_OUTPUT_PATH, "w") as file:
+            file.write(stats_json)
+        print("... stats written to " + STATS_OUTPUT_PATH + " ...")
 
-def main():
 
-    print("... loading dataset ... (1/5)")
-    dataset = pd.read_csv(DATASET_PATH,sep="|", index_col=0)
+def main_batch():
+    from batch_report import build_batch_reports
 
-    print("... cleaning dataset ... (2/5)")
-    cleaned_dataset = data_cleaner(dataset, account=ACCOUNT_NAME, period_start_date =START_DATE, period_end_date=END_DATE) # Beispieldaten
-    #cleaned_dataset.to_csv("dev_df.csv", index=False)
+    print("... loading and cleaning dataset ... (1-2/5)")
+    engine = get_data_engine()
+    cleaned_dataset = engine.to_pandas(load_cleaned_dataset(None, engine))
+
+    if len(cleaned_dataset) == 0:
+        print("No tasks were recorded in the given time frame.")
+        return
+
+    print("... building reports per account ... (3-5/5)")
+    with open("doc_config.json", "r") as file:
+        doc_config = json.load(file)
+    build_batch_reports(cleaned_dataset, doc_config, output_root=BATCH_OUTPUT_DIR,
+                        accounts=BATCH_ACCOUNTS, n_workers=N_WORKERS)
+
+    print("... batch finished ...")
+
+
+def main_periods():
+    from multi_period import make_periods, build_period_reports
+
+    print("... loading and cleaning dataset ... (1-2/5)")
+    engine = get_data_engine()
+    cleaned_dataset = engine.to_pandas(load_cleaned_dataset(ACCOUNT_NAME, engine))
 
     if len(cleaned_dataset) == 0:
         print("No tasks for this account were recorded in the given time frame.")
         return
 
-    print("... extracting stats ... (3/5)")
-    S = StatsExtractor(cleaned_dataset)
-    stats_dict = S.extract_stats()
-    #print(stats_dict)
-
-    print("... creating visualizations ... (4/5)")
-    # Make sure fig/ path exists
-    if not os.path.isdir("./fig"):
-        os.mkdir("./fig/")
-        
-    Viz = DataVisualizer(stats_dict, set_plot_config())
-    Viz.plot_all()
-
-    print("... building document ... (5/5)")
+    print("... building reports per period ... (3-5/5)")
     with open("doc_config.json", "r") as file:
         doc_config = json.load(file)
-    build_document(cleaned_dataset, stats_dict, doc_config)
-    
+    build_period_reports(cleaned_dataset, make_periods(START_DATE, END_DATE, PERIOD_FREQ), doc_config,
+                         output_root=BATCH_OUTPUT_DIR, n_workers=N_WORKERS)
+
+    print("... reports finished ...")
+
+
+def main():
+
+    if STATS_ONLY:
+        return main_stats()
+    if BATCH_MODE:
+        return main_batch()
+    if PERIOD_FREQ:
+        return main_periods()
+
+    from data_visualizer import DataVisualizer
+    from document_builder import build_document, get_fig_format
+    from plot_config import set_plot_config
+
+    with open("doc_config.json", "r") as file:
+        doc_config = json.load(file)
+
+    with RunProfile(cprofile_stages=CPROFILE_STAGES) as profile:
+
+        if AGGREGATE_STORE_PATH or COLUMN_STORE_PATH:
+            with profile.stage("load_clean_stats"):
+                stats_dict = extract_stats_from_store() if AGGREGATE_STORE_PATH else extract_stats_from_column_store()
+            if stats_dict is None:
+                return
+            # The document only needs the account and the time frame from the dataframe
+            cleaned_dataset = pd.DataFrame({"Account":[ACCOUNT_NAME], "PeriodStartDate":[START_DATE], "PeriodEndDate":[END_DATE]})
+
+        else:
+            print("... loading and cleaning dataset ... (1-2/5)")
+            engine = get_data_engine()
+            with profile.stage("load_clean") as record:
+                cleaned_dataset = load_cleaned_dataset(ACCOUNT_NAME, engine)
+                record["rows"] = len(cleaned_dataset)
+                record["bytes_per_row"] = round(engine.memory_per_row(cleaned_dataset), 1)
+            print(f"    {record['rows']} tasks, {record['bytes_per_row']} bytes per row")
+            #cleaned_dataset.to_csv("dev_df.csv", index=False)
+
+            if len(cleaned_dataset) == 0:
+                print("No tasks for this account were recorded in the given time frame.")
+                return
+
+            print("... extracting stats ... (3/5)")
+            with profile.stage("stats") as record:
+                S = engine.stats_extractor(cleaned_dataset)
+                stats_dict = S.extract_stats()
+                record["rows"] = len(cleaned_dataset)
+            # The document is built from the dataframe of data_cleaner
+            cleaned_dataset = engine.to_pandas(cleaned_dataset)
+            #print(stats_dict)
+
+        print("... creating visualizations ... (4/5)")
+        # The figures are rendered into memory and handed to the document builder
+        # (which writes them to fig/ for LaTeX)
+        with profile.stage("plot"):
+            Viz = DataVisualizer(stats_dict, set_plot_config(fig_format=get_fig_format(doc_config)))
+            figures = Viz.render_all()
+
+        print("... building document ... (5/5)")
+        with profile.stage("document"):
+            build_document(cleaned_dataset, stats_dict, doc_config, figures=figures)
+
+    if WRITE_PROFILE:
+        profile.save(doc_config["doc_name"] + "_profile.json")
+
     print("... report finished ...")
 
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+"""
+Generates reports for several periods (e.g. 12 months or 52 weeks) of the same account at once.
+The dataset is loaded and cleaned only once for the whole time frame. Every task is assigned to the
+periods it starts/ends in by binning its days on the sorted period bounds (PeriodQuery.assign), and
+the stats_dict of every period is extracted from its rows. The period is passed to StatsExtractor as
+scalars, so no period columns are materialized. Visualizations and documents are built in parallel
+in a process pool; every period gets its own output directory.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: cleaned dataframe of one account covering all periods, list of periods
+OUT: one stats_dict and report per period in output_root/<period_start_date>_<period_end_date>/
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from stats_extractor import StatsExtractor
+from period_query import PeriodQuery
+from data_visualizer import DataVisualizer, use_agg_backend
+from document_builder import build_document, get_fig_format
+from plot_config import set_plot_config
+
+
+def make_periods(start_date: str, end_date: str, freq: str="MS") -> list:
+    """
+    Splits the time frame into consecutive periods, e.g. months or weeks.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    start_date: str; format='yyyy-mm-dd'
+    end_date: str; format='yyyy-mm-dd'; included in the last period
+    freq: str; pandas frequency of the period starts, e.g. "MS" (months) or "W-MON" (weeks starting on Monday)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list of (period_start_date, period_end_date); format='yyyy-mm-dd'
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    starts = [start] + [day for day in pd.date_range(start, end, freq=freq) if day > start]
+    ends = [day - pd.Timedelta(days=1) for day in starts[1:]] + [end]
+    return [(first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")) for first, last in zip(starts, ends)]
+
+
+def select_rows(cleaned_dataset: pd.DataFrame, rows) -> pd.DataFrame:
+    """
+    Selects the rows of a period. Ties in the task counts of users and partitions are ordered by the
+    categories, so these are ordered by first appearance in the period, as by data_cleaner for the period.
+    """
+    dataset = cleaned_dataset.iloc[rows]
+    return dataset.assign(**{col: dataset[col].cat.set_categories(dataset[col].dropna().unique().tolist())
+                             for col in ["User", "Partition"] if isinstance(dataset[col].dtype, pd.CategoricalDtype)})
+
+
+def extract_period_stats(cleaned_dataset: pd.DataFrame, periods: list) -> list:
+    """
+    Extracts the stats_dict of every period from one cleaned dataset.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    cleaned_dataset: pd.DataFrame; cleaned data of a single account covering all periods
+                     (data_cleaner with a period from the first to the last day of the periods, or without period)
+    periods: list of (period_start_date, period_end_date); format='yyyy-mm-dd'
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list of dict; stats_dict of every period, None for periods without tasks
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    positions = PeriodQuery(cleaned_dataset["StartDate"], cleaned_dataset["EndDate"]).assign(periods)
+
+    stats_dicts = []
+    for (period_start_date, period_end_date), rows in zip(periods, positions):
+        if len(rows) == 0:
+            stats_dicts.append(None)
+            continue
+        S = StatsExtractor(select_rows(cleaned_dataset, rows), period_start_date=period_start_date, period_end_date=period_end_date)
+        stats_dicts.append(S.extract_stats())
+    return stats_dicts
+
+
+def build_period_report(account: str, period: tuple, stats_dict: dict, output_dir: str, doc_config: dict):
+    """
+    Builds visualizations and document of one period in output_dir.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    account: str
+    period: (period_start_date, period_end_date)
+    stats_dict: dict; stats of the period
+    output_dir: str; directory to write figures and report to
+    doc_config: dict extracted from doc_config.json
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    output_dir: str
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    Viz = DataVisualizer(stats_dict, set_plot_config(fig_format=get_fig_format(doc_config)))
+    figures = Viz.render_all()
+
+    # The document only needs the account and the time frame from the dataframe
+    header = pd.DataFrame({"Account": [account], "PeriodStartDate": [period[0]], "PeriodEndDate": [period[1]]})
+    build_document(header, stats_dict, doc_config, output_dir=output_dir, figures=figures)
+
+    return output_dir
+
+
+def build_period_reports(cleaned_dataset: pd.DataFrame, periods: list, doc_config: dict,
+                         output_root: str="reports", n_workers: int=None):
+    """
+    Extracts the stats of all periods in a single pass (see extract_period_stats) and builds
+    one report per period with tasks in a process pool.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    cleaned_dataset: pd.DataFrame; cleaned data of a single account covering all periods
+    periods: list of (period_start_date, period_end_date); format='yyyy-mm-dd'
+    doc_config: dict extracted from doc_config.json
+    output_root: str; reports are written to output_root/<period_start_date>_<period_end_date>/
+    n_workers: int or None; number of worker processes, None for the number of CPUs
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dict; period -> output directory of its report
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    account = cleaned_dataset["Account"].iloc[0]
+    stats_dicts = extract_period_stats(cleaned_dataset, periods)
+
+    output_dirs = {}
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=use_agg_backend) as executor:
+
+        futures = {}
+        for period, stats_dict in zip(periods, stats_dicts):
+            if stats_dict is None:
+                print(f"... no tasks for {period[0]} - {period[1]} ...")
+                continue
+            output_dir = os.path.join(output_root, f"{period[0]}_{period[1]}")
+            futures[executor.submit(build_period_report, account, period, stats_dict, output_dir, doc_config)] = period
+
+        for future in as_completed(futures):
+            period = futures[future]
+            try:
+                output_dirs[period] = future.result()
+                print(f"... report finished for {period[0]} - {period[1]} ...")
+            except Exception as e:
+                print(f"... report failed for {period[0]} - {period[1]}: {e!r} ...")
+
+    return output_dirs
@@ -0,0 +1,151 @@
+"""
+Columnar cache of the cleaned dataset.
+The dataset is converted once into a Parquet dataset which holds the output of data_cleaner
+before filtering by account and period. The cache is partitioned by the month in which the
+tasks started (tasks without start: the month in which they ended) and every partition is sorted
+by account, so that a request for one account and one time frame only reads the matching
+partitions and row groups. The position of every task in the dataset is stored to restore
+the row order of data_cleaner on read.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Layout:
+cache_path/
+    _cache_info.json            # name of the index column, longest task duration in days
+    Month=2021-08/part-0.parquet
+    Month=2021-09/part-0.parquet
+    ...
+
+Usage:
+python parquet_cache.py <dataset_path> <cache_path>
+"""
+
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_cleaner import data_cleaner, add_per_start_and_end_date_cols, compact_dtypes, LABEL_COLS, INT_COLS
+from data_loader import read_dataset_chunks, CHUNK_SIZE
+
+ROW_GROUP_SIZE = 100_000
+ROW_NUMBER_COL = "RowNumber" # position of the task in the dataset
+CACHE_INFO_FILE = "_cache_info.json"
+PARTITIONING = ds.partitioning(pa.schema([("Month", pa.string())]), flavor="hive")
+
+
+def build_parquet_cache(dataset_path: str, cache_path: str, chunksize: int=CHUNK_SIZE):
+    """
+    Converts the dataset into a Parquet cache. The dataset is streamed and cleaned chunk by
+    chunk (without account or period filter), written to a staging area and finally
+    rewritten into one file per month, sorted by account and start date. Tasks without start
+    are stored in the month in which they ended, tasks without start and end in 'Month=unknown'.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    dataset_path: str; path to pipe-separated csv file
+    cache_path: str; directory to write the cache to (is replaced if it exists)
+    chunksize: int; number of rows per chunk
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    None
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if os.path.isdir(cache_path):
+        shutil.rmtree(cache_path)
+    staging_path = os.path.join(cache_path, "_staging")
+
+    index_col = None
+    max_duration = pd.Timedelta(0)
+    n_rows = 0
+
+    # Stream, clean and stage chunks, partitioned by start month (end month if the task has no start)
+    for i, chunk in enumerate(read_dataset_chunks(dataset_path, chunksize=chunksize)):
+        cleaned_chunk = data_cleaner(chunk)
+        index_col = cleaned_chunk.index.name
+        cleaned_chunk = cleaned_chunk.reset_index()
+        cleaned_chunk[ROW_NUMBER_COL] = np.arange(n_rows, n_rows + len(cleaned_chunk), dtype=np.int64)
+        n_rows += len(cleaned_chunk)
+        cleaned_chunk["Month"] = (cleaned_chunk["StartDate"].fillna(cleaned_chunk["EndDate"])
+                                  .dt.strftime("%Y-%m").fillna("unknown"))
+
+        chunk_max_duration = (cleaned_chunk["EndDate"] - cleaned_chunk["StartDate"]).max()
+        if pd.notna(chunk_max_duration):
+            max_duration = max(max_duration, chunk_max_duration)
+
+        # Chunks are staged with a fixed schema (the compact dtypes of data_cleaner differ between chunks);
+        # strings are dictionary encoded by Parquet anyway
+        cleaned_chunk = cleaned_chunk.astype({**{col: object for col in LABEL_COLS if col in cleaned_chunk.columns},
+                                              **{col: "int64" for col in INT_COLS if pd.api.types.is_integer_dtype(cleaned_chunk[col])}})
+        table = pa.Table.from_pandas(cleaned_chunk, preserve_index=False)
+        ds.write_dataset(table, staging_path, format="parquet", partitioning=PARTITIONING,
+                         basename_template=f"chunk-{i}-{{i}}.parquet",
+                         existing_data_behavior="overwrite_or_ignore")
+
+    # Rewrite every month into a single file sorted by account (tight row group statistics)
+    for month_dir in sorted(os.listdir(staging_path)):
+        month_table = ds.dataset(os.path.join(staging_path, month_dir), format="parquet").to_table()
+        month_table = month_table.sort_by([("Account", "ascending"), ("StartDate", "ascending")])
+        os.makedirs(os.path.join(cache_path, month_dir))
+        pq.write_table(month_table, os.path.join(cache_path, month_dir, "part-0.parquet"),
+                       row_group_size=ROW_GROUP_SIZE)
+    shutil.rmtree(staging_path)
+
+    with open(os.path.join(cache_path, CACHE_INFO_FILE), "w") as file:
+        json.dump({"index_col": index_col, "max_duration_days": max_duration.days + 1}, file)
+
+
+def read_parquet_cache(cache_path: str, account: str, period_start_date: str, period_end_date: str):
+    """
+    Reads the data of one account in the given period from the Parquet cache.
+    Only months which can contain tasks starting or ending in the period are opened (tasks without
+    start are stored in the month in which they ended), and row groups are skipped based on their
+    account and date statistics. Returns the same dataframe as data_cleaner, in the same row order.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    cache_path: str; directory written by build_parquet_cache
+    account: str or None; None keeps all accounts
+    period_start_date: str; format='yyyy-mm-dd'
+    period_end_date: str; format='yyyy-mm-dd'
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    with open(os.path.join(cache_path, CACHE_INFO_FILE), "r") as file:
+        cache_info = json.load(file)
+
+    period_start = pd.to_datetime(period_start_date)
+    period_end = pd.to_datetime(period_end_date) + pd.Timedelta(days=1) # exclusive
+    first_month = (period_start - pd.Timedelta(days=cache_info["max_duration_days"])).strftime("%Y-%m")
+    last_month = pd.to_datetime(period_end_date).strftime("%Y-%m")
+
+    month = ds.field("Month")
+    start_date = ds.field("StartDate")
+    end_date = ds.field("EndDate")
+    row_filter = ((month >= first_month) & (month <= last_month)
+                  & (((start_date >= period_start.to_pydatetime()) & (start_date < period_end.to_pydatetime()))
+                     | ((end_date >= period_start.to_pydatetime()) & (end_date < period_end.to_pydatetime()))))
+    if account is not None:
+        row_filter = row_filter & (ds.field("Account") == account)
+
+    dataset = ds.dataset(cache_path, format="parquet", partitioning=PARTITIONING,
+                         exclude_invalid_files=True, ignore_prefixes=["_", "."])
+    table = dataset.to_table(filter=row_filter)
+
+    # Restore the layout of data_cleaner: original row order, index, period columns
+    table = table.sort_by(ROW_NUMBER_COL).drop([ROW_NUMBER_COL, "Month"])
+    subset = table.to_pandas().set_index(cache_info["index_col"])
+    subset = add_per_start_and_end_date_cols(subset, period_start_date, period_end_date)
+    subset = compact_dtypes(subset)
+    return subset
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python parquet_cache.py <dataset_path> <cache_path>")
+        sys.exit(1)
+    build_parquet_cache(sys.argv[1], sys.argv[2])
@@ -0,0 +1,139 @@
+"""
+Answers the question "which tasks start or end in a period?" for one loaded dataset.
+The start and end days are held as datetime64 arrays (no copy of the dataframe) and
+can be queried for any number of periods:
+    * mask(): boolean mask over all tasks, computed in a single vectorized pass
+    * positions(): row positions of the tasks; uses start and end days sorted once,
+      so that every further period only costs two binary searches per column
+    * assign(): row positions of the tasks for a list of periods at once; every task is binned
+      into the periods it starts/ends in with binary searches over the sorted period bounds
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: start and end days of tasks
+OUT: boolean mask or row positions of the tasks which start or/and end in a period
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def to_day(date, dtype):
+    """
+    Convert a date ('yyyy-mm-dd', datetime or pd.Timestamp) to a datetime64 scalar of the given dtype.
+    """
+    return np.datetime64(pd.Timestamp(date).floor("D")).astype(dtype)
+
+
+class PeriodQuery:
+
+
+    def __init__(self, start_dates, end_dates):
+        self.start_dates = np.asarray(start_dates)
+        self.end_dates = np.asarray(end_dates)
+        self._start_order = None
+        self._end_order = None
+
+
+    def mask(self, period_start_date, period_end_date) -> np.ndarray:
+        """
+        Computes the mask of tasks which start or/and end in period.
+        Tasks without start or end day (NaT) are only matched by the other day.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        period_start_date: str; format='yyyy-mm-dd'
+        period_end_date: str; format='yyyy-mm-dd'; the period includes this day
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        np.ndarray of bool
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        period_start, period_end = self._get_bounds(period_start_date, period_end_date)
+
+        mask = self.start_dates >= period_start
+        mask &= self.start_dates < period_end
+        ends_in_period = self.end_dates >= period_start
+        ends_in_period &= self.end_dates < period_end
+        mask |= ends_in_period
+        return mask
+
+
+    def positions(self, period_start_date, period_end_date) -> np.ndarray:
+        """
+        Computes the row positions of tasks which start or/and end in period, in ascending order.
+        The start and end days are sorted on the first call only, so this is the method of
+        choice to query many periods on the same data.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        period_start_date: str; format='yyyy-mm-dd'
+        period_end_date: str; format='yyyy-mm-dd'; the period includes this day
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        np.ndarray of int
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if self._start_order is None:
+            self._start_order = np.argsort(self.start_dates, kind="stable")
+            self._end_order = np.argsort(self.end_dates, kind="stable")
+            self._sorted_start_dates = self.start_dates[self._start_order]
+            self._sorted_end_dates = self.end_dates[self._end_order]
+
+        bounds = self._get_bounds(period_start_date, period_end_date)
+        start_lo, start_hi = np.searchsorted(self._sorted_start_dates, bounds, side="left")
+        end_lo, end_hi = np.searchsorted(self._sorted_end_dates, bounds, side="left")
+
+        return np.union1d(self._start_order[start_lo:start_hi], self._end_order[end_lo:end_hi])
+
+
+    def assign(self, periods: list) -> list:
+        """
+        Computes the row positions of tasks which start or/and end in each of the periods, like
+        positions() for every period. For non-overlapping periods (e.g. months or weeks), every task
+        is assigned to the period it starts in and the period it ends in by binary searches of its
+        days in the sorted period bounds, i.e. in a single pass over the tasks regardless of the
+        number of periods. Overlapping periods are queried one by one with positions().
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        periods: list of (period_start_date, period_end_date); format='yyyy-mm-dd'
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        list of np.ndarray of int; row positions (ascending) for every period
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        bounds = np.array([self._get_bounds(*period) for period in periods], dtype=self.start_dates.dtype).reshape(-1, 2)
+        order = np.argsort(bounds[:,0], kind="stable")
+        period_starts, period_ends = bounds[order,0], bounds[order,1]
+        if np.any(period_starts[1:] < period_ends[:-1]):
+            return [self.positions(*period) for period in periods]
+
+        # Bin of every day: the last period starting on or before it, if the day is before its end (NaT: no bin)
+        n_rows = len(self.start_dates)
+        bins = []
+        for days in (self.start_dates, self.end_dates):
+            day_bins = np.searchsorted(period_starts, days, side="right") - 1
+            in_period = day_bins >= 0
+            in_period[in_period] = days[in_period] < period_ends[day_bins[in_period]]
+            bins.append(np.where(in_period, day_bins, -1))
+        start_bins, end_bins = bins
+
+        # (period, row) pairs; tasks which start and end in the same period are taken once
+        rows = np.arange(n_rows)
+        from_start = start_bins >= 0
+        from_end = (end_bins >= 0) & (end_bins != start_bins)
+        keys = np.sort(np.concatenate((start_bins[from_start] * n_rows + rows[from_start],
+                                       end_bins[from_end] * n_rows + rows[from_end])))
+        offsets = np.searchsorted(keys, np.arange(len(periods) + 1) * n_rows)
+        sorted_positions = [keys[offsets[i]:offsets[i+1]] - i * n_rows for i in range(len(periods))]
+
+        # Back to the order of the input periods
+        positions = [None] * len(periods)
+        for i, period_index in enumerate(order):
+            positions[period_index] = sorted_positions[i]
+        return positions
+
+
+    def _get_bounds(self, period_start_date, period_end_date):
+        """
+        Returns the period as half-open interval [period_start, period_end + 1 day).
+        """
+        period_start = to_day(period_start_date, self.start_dates.dtype)
+        period_end = to_day(period_end_date, self.start_dates.dtype) + np.timedelta64(1, "D")
+        return period_start, period_end
@@ -27,10 +27,13 @@ def truncate_colormap(cmap, minval=0.0, maxval=1.0, n=100):
 
 
 
-def set_plot_config():
+def set_plot_config(fig_format: str="jpg"):
     """
     Set default values for visualization
     -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    fig_format: str; file format of the figures: "pdf", "png" or "jpg" (LaTeX report), "svg", "png" or "jpg" (HTML report)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
     Returns: plot_config: dict
     """
     plot_config = {}
@@ -46,5 +49,9 @@ def set_plot_config():
     plot_config['leg_font_size'] = 8
     plot_config['bar_width'] = 0.35
     plot_config['dpi'] = 300
+    plot_config['fig_format'] = fig_format
+    plot_config['n_workers'] = 1 # number of processes rendering figures in parallel
+    plot_config['fig_cache_dir'] = '.fig_cache' # cache of rendered figures, None to disable
+    plot_config['fig_cache_max_bytes'] = 200_000_000
 
     return plot_config
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Mergeable quantile sketch for the task metrics (AllocCPUS, ElapsedRaw, CPUTimeRaw).
+The sketch sorts values into logarithmically sized buckets (as in DDSketch): value x > 0 falls
+into bucket i with gamma**(i-1) < x <= gamma**i, where gamma = (1 + alpha) / (1 - alpha).
+Zeros are counted separately. Count, sum, min and max are tracked exactly.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Error bound:
+quantile(q) returns a value within a relative error of alpha (relative_accuracy) of the
+order statistic with rank floor(q * (count - 1)) of all values added, no matter how the values
+were split into chunks, periods or accounts and in which order the sketches were merged.
+min, max and mean are exact. The size of a sketch only depends on the range of the values,
+e.g. ~1200 buckets for values between 1 and 1e10 with alpha = 0.01.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+Usage:
+sketch = QuantileSketch()
+for chunk in chunks:
+    sketch.update(chunk["ElapsedRaw"].to_numpy())
+sketch.merge(QuantileSketch.from_dict(json.load(file)))
+sketch.summary() # [min, 5quant, 25quant, median, 75quant, 95quant, max, mean]
+"""
+
+import math
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+SUMMARY_QUANTILES = [.05, .25, .5, .75, .95]
+
+
+class QuantileSketch:
+
+
+    def __init__(self, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1.")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+
+        self.bins = {} # bucket index -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+
+    def update(self, values):
+        """
+        Adds values (e.g. one chunk of a metric column) to the sketch.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        values: 1D array-like of non-negative numbers
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        self
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        values = np.asarray(values)
+        values = values[~np.isnan(values)] if values.dtype.kind == "f" else values
+        if len(values) == 0:
+            return self
+        if values.min() < 0:
+            raise ValueError("QuantileSketch only accepts non-negative values.")
+
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+
+        indices, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+
+        self.count += len(values)
+        self.sum += values.sum().item()
+        self.min = min(self.min, values.min().item())
+        self.max = max(self.max, values.max().item())
+        return self
+
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Adds all values of another sketch with the same relative accuracy to this sketch.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        other: QuantileSketch
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        self
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative_accuracy can be merged.")
+
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile (see module docstring for the error bound). NaN if the sketch is empty.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        q: float in [0, 1]
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        float
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        return self.quantiles([q])[0]
+
+
+    def quantiles(self, qs: list) -> list:
+        """
+        Estimates several quantiles at once.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        qs: list of float in [0, 1]
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        list of float
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if self.count == 0:
+            return [np.nan for q in qs]
+
+        indices = np.array(sorted(self.bins), dtype=np.int64)
+        cum_counts = self.zero_count + np.cumsum([self.bins[i] for i in indices.tolist()], dtype=np.int64)
+
+        estimates = []
+        for q in qs:
+            rank = math.floor(q * (self.count - 1))
+            if rank < self.zero_count:
+                estimates.append(0.0)
+                continue
+            index = indices[np.searchsorted(cum_counts, rank, side="right")]
+            estimate = 2 * self.gamma ** index / (self.gamma + 1)
+            estimates.append(float(min(max(estimate, self.min), self.max)))
+        return estimates
+
+
+    def summary(self) -> list:
+        """
+        Returns [min, 5quant, 25quant, median, 75quant, 95quant, max, mean] in the layout of
+        the task metrics in the stats_dict. min, max and mean are exact, quantiles are estimates.
+        """
+        if self.count == 0:
+            return [np.nan] * 8
+        q05, q25, median, q75, q95 = self.quantiles(SUMMARY_QUANTILES)
+        return [self.min, q05, q25, median, q75, q95, self.max, round(self.sum / self.count, 3)]
+
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the sketch into a JSON-compatible dict.
+        """
+        return {"relative_accuracy": self.relative_accuracy,
+                "bins": {str(index): count for index, count in self.bins.items()},
+                "zero_count": self.zero_count, "count": self.count, "sum": self.sum,
+                "min": self.min if self.count else None, "max": self.max if self.count else None}
+
+
+    @classmethod
+    def from_dict(cls, sketch_dict: dict) -> "QuantileSketch":
+        """
+        Restores a sketch serialized with to_dict.
+        """
+        sketch = cls(sketch_dict["relative_accuracy"])
+        sketch.bins = {int(index): count for index, count in sketch_dict["bins"].items()}
+        sketch.zero_count = sketch_dict["zero_count"]
+        sketch.count = sketch_dict["count"]
+        sketch.sum = sketch_dict["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = sketch_dict["min"], sketch_dict["max"]
+        return sketch
+
+
+def merge_sketches(sketches: list, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY) -> QuantileSketch:
+    """
+    Merges a list of sketches (e.g. of several months or accounts) into a new sketch.
+    """
+    merged = QuantileSketch(relative_accuracy)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
@@ -0,0 +1,110 @@
+"""
+Ingests the output of sacct directly, without dumping it to a file first.
+sacct (or any command printing the same pipe-separated format, e.g. 'python data_generator.py <n_rows> -')
+is run as subprocess, or the output is read from stdin. The rows are parsed and cleaned chunk by chunk
+while the command is still running, so the report generation overlaps with the extraction of the data.
+-- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+IN: command printing 'sacct --parsable2' output, or "-" for stdin
+OUT: cleaned dataframe (same as data_cleaner)
+
+Usage (stdin):
+sacct --allusers --parsable2 --format=JobID,Account,... | python main.py   # with SACCT_COMMAND = "-"
+"""
+
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from data_cleaner import REL_COLS
+from data_loader import clean_chunks, CHUNK_SIZE
+
+SACCT_FIELDS = ["JobID"] + REL_COLS # fields requested from sacct; JobID is the index
+
+
+def sacct_command(period_start_date: str, period_end_date: str, account: str=None) -> list:
+    """
+    Builds the sacct command which prints all tasks running in the period in the format of the dataset.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    period_start_date: str; format='yyyy-mm-dd'
+    period_end_date: str; format='yyyy-mm-dd'
+    account: str or None; None for all accounts
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list of str
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    command = ["sacct", "--allusers", "--parsable2", "--format=" + ",".join(SACCT_FIELDS),
+               "--starttime", period_start_date, "--endtime", period_end_date + "T23:59:59"]
+    if account is not None:
+        command += ["--accounts", account]
+    return command
+
+
+def read_stream_chunks(stream, chunksize: int=CHUNK_SIZE):
+    """
+    Reads pipe-separated sacct output from a text stream chunk by chunk, like
+    data_loader.read_dataset_chunks. Chunks are returned as soon as their rows have arrived.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    stream: text file object (e.g. stdout of a subprocess or sys.stdin)
+    chunksize: int; number of rows per chunk
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    iterator of pd.DataFrame
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    # The header is read separately, since a stream cannot be read twice
+    header = stream.readline().rstrip("\n").split("|")
+    if header == [""]:
+        raise ValueError("The sacct output is empty (no header).")
+    use_cols = [header[0]] + [col for col in REL_COLS if col in header]
+
+    return pd.read_csv(stream, sep="|", header=None, names=header, index_col=0, usecols=use_cols,
+                       dtype={"Start": str, "End": str}, chunksize=chunksize)
+
+
+def load_sacct_stream(command, account: str, period_start_date: str, period_end_date: str,
+                      chunksize: int=CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Runs the command (or reads stdin) and cleans its output on the fly. If the command fails,
+    subprocess.CalledProcessError is raised (with its error output), also if it printed no output.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    command: list of str (e.g. sacct_command(...)), or "-" to read from stdin
+    account: str or None; None for all accounts
+    period_start_date: str; format='yyyy-mm-dd'
+    period_end_date: str; format='yyyy-mm-dd'
+    chunksize: int; number of rows per chunk
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dataset: pd.DataFrame; same as data_cleaner
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    if command == "-":
+        return clean_chunks(read_stream_chunks(sys.stdin, chunksize=chunksize), account,
+                            period_start_date, period_end_date)
+
+    # The error output is kept for the CalledProcessError (and passed on if the command succeeds)
+    with tempfile.TemporaryFile(mode="w+") as error_output:
+        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=error_output, text=True) as process:
+            try:
+                dataset = clean_chunks(read_stream_chunks(process.stdout, chunksize=chunksize), account,
+                                       period_start_date, period_end_date)
+            except ValueError:
+                # A failing command prints no or incomplete output; then its exit status is the actual error
+                process.communicate()
+                if process.returncode == 0:
+                    raise
+            except BaseException:
+                process.kill()
+                raise
+
+        error_output.seek(0)
+        stderr = error_output.read()
+    print(stderr, end="", file=sys.stderr)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr)
+    return dataset
@@ -11,6 +11,11 @@ OUT: dict of dicts, e.g.
                         "CPUTimeRaw":...}
 
         "termination_stats":{"n_complete":int, "n_cancelled":int, "n_failed":int, "n_timeout":int} # only include tasks which started AND ended in timeframe
+
+        "core_utilization":{"peak":int, "mean":float, "p95":int, # CPUs allocated at the same time; includes all tasks
+                            "bin_hours":int, "bin_start":list[str], "bin_mean":list[float], "bin_max":list[int]}
+
+        "prorated_cpu_time": int # CPU seconds within the timeframe (run time clipped to the timeframe x AllocCPUS); includes all tasks
     },
 
     "user_split":{
@@ -19,7 +24,8 @@ OUT: dict of dicts, e.g.
         "basic_stats": {"num_started_and_ended":list[int], ...},
         "task_metrics": {"alloccpu":[[user1_min, user1_05quant, user1_25quant, user1_median, user1_75quant, user1_95quant, user1_max, user1mean],
                                      [user2_min, user2_05quant, user2_25quant, user2_median, user2_75quant, user2_95quant, user2_max, user2mean],
-                                     ...]}
+                                     ...]},
+        "prorated_cpu_time": list[int]
     },
 
     "partition_split:{
@@ -27,25 +33,223 @@ OUT: dict of dicts, e.g.
         "partition_counts": list,
         "basic_stats": {"num_started_and_ended":list[int], ...},
         "task_metrics": ...,
+        "prorated_cpu_time": list[int]
     }
 }
 })
 """
 
+import json
+
 import pandas as pd
 import numpy as np
 
+from quantile_sketch import QuantileSketch, DEFAULT_RELATIVE_ACCURACY
+from instrumentation import run_step
+
+
+QUANTILES = [.05, .25, .75, .95]
+MAX_UTILIZATION_BINS = 1000 # bins of the core utilization curve
+
+
+def segment_summaries(values: np.ndarray, group_codes: np.ndarray, n_groups: int) -> list:
+    """
+    Computes [min, 5quant, 25quant, median, 75quant, 95quant, max, mean] of values for every group.
+    The values are sorted once by (group, value); all statistics are then read from the offsets
+    of the groups' segments. The results are identical to the pandas methods (min, quantile with
+    linear interpolation, median, max, mean rounded to 3 decimals). Empty groups yield NaNs.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    values: 1D np.ndarray; metric of every task.
+    group_codes: 1D np.ndarray of int; group of every task in range(n_groups).
+    n_groups: int; number of groups.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    list (one entry per group) of lists with 8 values.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    valid = group_codes >= 0
+    values, group_codes = values[valid], group_codes[valid]
+    # Compute in 64 bit independent of the (compact) dtype of the column, e.g. a + b must not overflow int8
+    values = values.astype(np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64, copy=False)
+
+    # Sort by group, then by value
+    order = np.lexsort((values, group_codes))
+    sorted_values = values[order]
+
+    counts = np.bincount(group_codes, minlength=n_groups)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    non_empty = np.flatnonzero(counts)
+    starts, n = offsets[non_empty], counts[non_empty]
+
+    def quantile(q):
+        # Linear interpolation between the neighbouring order statistics (as in np.percentile)
+        virtual_index = (n - 1) * q
+        lower = np.floor(virtual_index).astype(np.intp)
+        upper = np.minimum(lower + 1, n - 1)
+        gamma = virtual_index - lower
+        a, b = sorted_values[starts + lower], sorted_values[starts + upper]
+        diff = b - a
+        return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+    mins = sorted_values[starts]
+    maxs = sorted_values[starts + n - 1]
+    q05, q25, q75, q95 = [quantile(q) for q in QUANTILES]
+    medians = (sorted_values[starts + (n - 1) // 2].astype(np.float64) + sorted_values[starts + n // 2]) / 2
+
+    # Sums of integer metrics are exact in int64
+    sum_dtype = np.int64 if np.issubdtype(sorted_values.dtype, np.integer) else np.float64
+    sums = np.add.reduceat(sorted_values.astype(sum_dtype, copy=False), starts) if len(starts) else np.zeros(0)
+    means = np.round(sums / n, 3)
+
+    summaries = [[np.nan] * 8 for _ in range(n_groups)]
+    for i, group in enumerate(non_empty):
+        summaries[group] = [mins[i], q05[i], q25[i], medians[i], q75[i], q95[i], maxs[i], means[i]]
+    return summaries
+
+
+def clip_to_period(starts: np.ndarray, ends: np.ndarray, period_start: np.datetime64, period_end: np.datetime64) -> tuple:
+    """
+    Clips the run time [start, end) of every task to the period. Tasks without end (still running) run
+    until the end of the period; tasks without start (not started) get an empty interval.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    starts: np.ndarray of datetime64; start of every task.
+    ends: np.ndarray of datetime64; end of every task.
+    period_start: np.datetime64; first second of the period.
+    period_end: np.datetime64; end of the period (exclusive).
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    tuple of np.ndarray of int; (clipped starts, clipped ends) in seconds since epoch.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    p0, p1 = period_start.astype("datetime64[s]").astype(np.int64), period_end.astype("datetime64[s]").astype(np.int64)
+    starts, ends = starts.astype("datetime64[s]"), ends.astype("datetime64[s]")
+    clipped_starts = np.clip(np.where(np.isnat(starts), p1, starts.astype(np.int64)), p0, p1)
+    clipped_ends = np.clip(np.where(np.isnat(ends), p1, ends.astype(np.int64)), clipped_starts, p1)
+    return clipped_starts, clipped_ends
+
+
+def core_utilization(starts: np.ndarray, ends: np.ndarray, alloc_cpus: np.ndarray, period_start: np.datetime64,
+                     period_end: np.datetime64, max_bins: int=MAX_UTILIZATION_BINS) -> dict:
+    """
+    Computes the number of CPUs allocated at the same time over the period with a sweep over the
+    sorted start (+AllocCPUS) and end (-AllocCPUS) events of the tasks, in O(n log n).
+    Tasks are clipped to the period; tasks without end (still running) count until the end of the period.
+    Peak, time-weighted mean and time-weighted 95th percentile refer to the whole period; for the
+    plot, the curve is reduced to at most max_bins bins (of whole hours) with their mean and max.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    starts: np.ndarray of datetime64; start of every task (NaT: not started, ignored).
+    ends: np.ndarray of datetime64; end of every task (NaT: still running).
+    alloc_cpus: np.ndarray of int; allocated CPUs of every task.
+    period_start: np.datetime64; first second of the period.
+    period_end: np.datetime64; end of the period (exclusive).
+    max_bins: int; maximum number of bins.
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    dict; {"peak": int, "mean": float, "p95": int, "bin_hours": int,
+           "bin_start": list of str, "bin_mean": list of float, "bin_max": list of int}
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    p0, p1 = period_start.astype("datetime64[s]").astype(np.int64), period_end.astype("datetime64[s]").astype(np.int64)
+    task_starts, task_ends = clip_to_period(starts, ends, period_start, period_end)
+    overlapping = task_ends > task_starts
+    cpus = alloc_cpus[overlapping].astype(np.int64)
+
+    # Sweep over the events; at equal times, ends are processed before starts
+    times = np.concatenate(([p0], task_starts[overlapping], task_ends[overlapping]))
+    deltas = np.concatenate(([0], cpus, -cpus))
+    order = np.argsort(times * 2 + (deltas > 0)) # one integer sort key: time, then ends before starts
+    times, levels = times[order], np.cumsum(deltas[order])
+    # Keep the level after the last event at each time: step function levels[i] on [times[i], times[i+1])
+    last = np.append(times[1:] != times[:-1], True)
+    times, levels = times[last], levels[last]
+    durations = np.diff(np.append(times, p1))
+    total = p1 - p0
+
+    peak = levels[durations > 0].max() if (durations > 0).any() else 0
+    mean = (levels * durations).sum() / total
+    level_order = np.argsort(levels, kind="stable")
+    cum_durations = np.cumsum(durations[level_order])
+    p95 = levels[level_order][min(np.searchsorted(cum_durations, 0.95 * total), len(levels) - 1)]
+
+    # Bins of whole hours: mean from the integral of the curve, max over the steps in the bin
+    bin_seconds = 3600 * max(1, int(np.ceil(total / 3600 / max_bins)))
+    edges = np.append(np.arange(p0, p1, bin_seconds), p1)
+    integral = np.concatenate(([0], np.cumsum(levels * durations)))
+    first = np.searchsorted(times, edges, side="right") - 1
+    integral_at_edges = integral[first] + levels[first] * (edges - times[first])
+    bin_mean = np.diff(integral_at_edges) / np.diff(edges)
+    last = np.searchsorted(times, edges[1:], side="left") - 1
+    positive_levels = np.append(np.where(durations > 0, levels, 0), 0)
+    bin_max = np.maximum.reduceat(positive_levels, np.ravel(np.column_stack((first[:-1], last + 1))))[::2]
+
+    return {"peak": int(peak), "mean": round(float(mean), 3), "p95": int(p95), "bin_hours": bin_seconds // 3600,
+            "bin_start": np.datetime_as_string(edges[:-1].astype("datetime64[s]"), unit="m").tolist(),
+            "bin_mean": np.round(bin_mean, 3).tolist(), "bin_max": bin_max.tolist()}
+
+
+def to_json_types(obj):
+    """
+    Converts the numpy types of a JSON-like object such as a stats_dict (e.g. counts as np.int64)
+    to Python types and NaNs (e.g. task metrics of groups without finished tasks) to None.
+    """
+    if isinstance(obj, dict):
+        return {key: to_json_types(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return [to_json_types(value) for value in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and np.isnan(obj):
+        return None
+    return obj
+
+
+def stats_to_json(stats_dict: dict, indent: int=None) -> str:
+    """
+    Serializes a stats_dict (e.g. for monitoring systems).
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Arguments:
+    stats_dict: dict or None; returned by extract_stats
+    indent: int or None; indentation of the JSON, None for a single line
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    Returns:
+    str; JSON ("null" if stats_dict is None)
+    -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+    """
+    return json.dumps(to_json_types(stats_dict), indent=indent, allow_nan=False)
+
 
 class StatsExtractor:
 
 
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, use_sketches: bool=False, relative_accuracy: float=DEFAULT_RELATIVE_ACCURACY,
+                 period_start_date: str=None, period_end_date: str=None):
         self.df = df
+        self.use_sketches = use_sketches # estimate task metric quantiles with mergeable sketches
+        self.relative_accuracy = relative_accuracy
         self.account = df["Account"].iloc[0]
-        self.partitions = df["Partition"].value_counts(ascending=False).index.tolist()
-        self.partition_counts = df["Partition"].value_counts(ascending=False).values.tolist()
-        self.users = df["User"].value_counts(ascending=False).index.tolist()
-        self.user_counts = df["User"].value_counts(ascending=False).values.tolist()
+        # Categoricals also count categories without tasks (e.g. users of other accounts), these are dropped
+        partition_counts = df["Partition"].value_counts(ascending=False)
+        partition_counts = partition_counts[partition_counts > 0]
+        self.partitions = partition_counts.index.tolist()
+        self.partition_counts = partition_counts.values.tolist()
+        user_counts = df["User"].value_counts(ascending=False)
+        user_counts = user_counts[user_counts > 0]
+        self.users = user_counts.index.tolist()
+        self.user_counts = user_counts.values.tolist()
+
+        # Masks of tasks which started/ended in period (the period is the same for all rows;
+        # it is passed as scalars if df has no period columns, e.g. in multi_period.py)
+        self.period_start_date = pd.to_datetime(df["PeriodStartDate"].iloc[0] if period_start_date is None else period_start_date)
+        self.period_end_date = pd.to_datetime(df["PeriodEndDate"].iloc[0] if period_end_date is None else period_end_date)
+        self.started = (df["StartDate"] >= self.period_start_date).to_numpy()
+        self.ended = (df["EndDate"] <= self.period_end_date).to_numpy()
+        self.started_and_ended = self.started & self.ended
+
+        self._group_codes = {}
+        self._prorated_cpu_time = None
 
 
     def extract_stats(self) -> dict:
@@ -62,24 +266,32 @@ class StatsExtractor:
         stats_dict = {}
 
         # Extract stats for full dataset
-        stats_dict["full"] = {"basic_stats":self.get_basic_stats(split="Full"),
-                              "task_metrics":self.get_task_metrics(split="Full"),
-                              "termination_stats":self.get_termination_stats()
+        stats_dict["full"] = {"basic_stats":run_step("basic_stats/full", self.get_basic_stats, split="Full"),
+                              "task_metrics":run_step("task_metrics/full", self.get_task_metrics, split="Full"),
+                              "termination_stats":run_step("termination_stats/full", self.get_termination_stats)
         }
+        core_utilization = run_step("core_utilization/full", self.get_core_utilization)
+        if core_utilization is not None:
+            stats_dict["full"]["core_utilization"] = core_utilization
+            stats_dict["full"]["prorated_cpu_time"] = run_step("prorated_cpu_time/full", self.get_prorated_cpu_time, split="Full")
 
         if len(self.users) >= 2:
             stats_dict["user_split"] = {"user_names":self.users,
                                         "user_counts":self.user_counts,
-                                        "basic_stats":self.get_basic_stats(split="User"),
-                                        "task_metrics":self.get_task_metrics(split="User")
+                                        "basic_stats":run_step("basic_stats/user", self.get_basic_stats, split="User"),
+                                        "task_metrics":run_step("task_metrics/user", self.get_task_metrics, split="User")
             }
+            if core_utilization is not None:
+                stats_dict["user_split"]["prorated_cpu_time"] = run_step("prorated_cpu_time/user", self.get_prorated_cpu_time, split="User")
 
         if len(self.partitions) >= 2:
             stats_dict["partition_split"] = {"partition_names":self.partitions,
                                             "partition_counts":self.partition_counts,
-                                            "basic_stats":self.get_basic_stats(split="Partition"),
-                                            "task_metrics":self.get_task_metrics(split="Partition")
+                                            "basic_stats":run_step("basic_stats/partition", self.get_basic_stats, split="Partition"),
+                                            "task_metrics":run_step("task_metrics/partition", self.get_task_metrics, split="Partition")
             }
+            if core_utilization is not None:
+                stats_dict["partition_split"]["prorated_cpu_time"] = run_step("prorated_cpu_time/partition", self.get_prorated_cpu_time, split="Partition")
 
         return stats_dict
 
@@ -106,25 +318,19 @@ class StatsExtractor:
 
             basic_dict = {}
 
-            basic_dict["n_start_end"] = ((self.df["StartDate"] >= self.df["PeriodStartDate"]) & (self.df["EndDate"] <= self.df["PeriodEndDate"])).sum()
-            basic_dict["n_start"] = (self.df["StartDate"] >= self.df["PeriodStartDate"]).sum()
-            basic_dict["n_end"] = (self.df["EndDate"] <= self.df["PeriodEndDate"]).sum()
+            basic_dict["n_start_end"] = self.started_and_ended.sum()
+            basic_dict["n_start"] = self.started.sum()
+            basic_dict["n_end"] = self.ended.sum()
 
 
-        # If split "User" or "Partition", extract stats for each user or partition
+        # If split "User" or "Partition", extract stats for all users or partitions at once
         elif split=="User" or split=="Partition":
             
-            basic_dict = {"n_start_end":[], "n_start":[], "n_end":[]}
-
-            split_list = self.users if split=="User" else self.partitions # Set appropriate iterable
-
-            for element in split_list:
-                
-                df_sub = self.df[self.df[split] == element] # Slice df down to specific user or partition
+            basic_dict = {}
 
-                basic_dict["n_start_end"].append(((df_sub["StartDate"] >= df_sub["PeriodStartDate"]) & (df_sub["EndDate"] <= df_sub["PeriodEndDate"])).sum())
-                basic_dict["n_start"].append((df_sub["StartDate"] >= df_sub["PeriodStartDate"]).sum())
-                basic_dict["n_end"].append((df_sub["EndDate"] <= df_sub["PeriodEndDate"]).sum())
+            basic_dict["n_start_end"] = self.count_by_group(split, self.started_and_ended)
+            basic_dict["n_start"] = self.count_by_group(split, self.started)
+            basic_dict["n_end"] = self.count_by_group(split, self.ended)
                 
         else:
             raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
@@ -147,37 +353,78 @@ class StatsExtractor:
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         """
 
-        df_time_sub = self.df[(self.df["StartDate"] >= self.df["PeriodStartDate"]) & (self.df["EndDate"] <= self.df["PeriodEndDate"])]
-
         metrics = ["AllocCPUS", "ElapsedRaw", "CPUTimeRaw"]
 
+        # Only include tasks which started AND ended in period
         if split=="Full":
+            group_codes = np.zeros(self.started_and_ended.sum(), dtype=np.intp)
+            n_groups = 1
+        elif split=="User" or split=="Partition":
+            group_codes = self.get_group_codes(split)[self.started_and_ended]
+            n_groups = len(self.users) if split=="User" else len(self.partitions)
+        else:
+            raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
 
-            metrics_dict = {}
+        if self.use_sketches:
+            sketches = self.get_task_sketches(split)
+            if split=="Full":
+                return {metric: sketches[metric].summary() for metric in metrics}
+            split_list = self.users if split=="User" else self.partitions
+            return {metric: [sketches[metric][name].summary() if name in sketches[metric] else [np.nan] * 8
+                             for name in split_list] for metric in metrics}
 
-            for metric in metrics:
-                metrics_dict[metric] = [df_time_sub[metric].min(), df_time_sub[metric].quantile(.05), df_time_sub[metric].quantile(.25), df_time_sub[metric].median(),
-                df_time_sub[metric].quantile(.75), df_time_sub[metric].quantile(.95), df_time_sub[metric].max(), round(df_time_sub[metric].mean(),3)]
+        metrics_dict = {}
+
+        for metric in metrics:
+            values = self.get_metric_values(metric)[self.started_and_ended]
+            summaries = segment_summaries(values, group_codes, n_groups)
+            metrics_dict[metric] = summaries[0] if split=="Full" else summaries
+
+        return metrics_dict
+
+
+    def get_task_sketches(self, split:str="Full") -> dict:
+        """
+        Builds mergeable quantile sketches (see quantile_sketch.py) of the task metrics of tasks
+        which started and ended in the given time period. The sketches can be serialized with
+        to_dict() and merged across periods or accounts.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        split: str in ["Full", "User", or "Partition"]; default: "Full".
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        dict; metric -> QuantileSketch for split "Full",
+              metric -> {user or partition name -> QuantileSketch} otherwise.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        metrics = ["AllocCPUS", "ElapsedRaw", "CPUTimeRaw"]
+
+        if split=="Full":
+            return {metric: QuantileSketch(self.relative_accuracy).update(self.get_metric_values(metric)[self.started_and_ended])
+                    for metric in metrics}
 
         elif split=="User" or split=="Partition":
-            
-            metrics_dict = {m:[] for m in metrics}
 
-            split_list = self.users if split=="User" else self.partitions # Set appropriate iterable
+            split_list = self.users if split=="User" else self.partitions
+            group_codes = self.get_group_codes(split)[self.started_and_ended]
 
-            for element in split_list:
-                
-                df_sub = df_time_sub[df_time_sub[split] == element] # Slice df down to specific user or partition
-                
-                for metric in metrics:
-                    metrics_dict[metric].append([df_sub[metric].min(), df_sub[metric].quantile(.05), df_sub[metric].quantile(.25), df_sub[metric].median(),
-                                                df_sub[metric].quantile(.75), df_sub[metric].quantile(.95), df_sub[metric].max(), round(df_sub[metric].mean(),3)])
-                
+            # Sort tasks by group once and cut the metrics into the groups' segments
+            order = np.argsort(group_codes, kind="stable")
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(group_codes[group_codes >= 0], minlength=len(split_list)))))
+            offsets += (group_codes < 0).sum()
 
-        return metrics_dict
+            sketches_dict = {}
+            for metric in metrics:
+                values = self.get_metric_values(metric)[self.started_and_ended][order]
+                sketches_dict[metric] = {name: QuantileSketch(self.relative_accuracy).update(values[offsets[i]:offsets[i+1]])
+                                         for i, name in enumerate(split_list) if offsets[i+1] > offsets[i]}
+            return sketches_dict
+
+        else:
+            raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
 
 
-    def get_termination_stats(self) -> dict:
+    def get_termination_stats(self, split:str="Full") -> dict:
         """
         Extracts task metrics:
             * number of completed tasks
@@ -187,27 +434,147 @@ class StatsExtractor:
         in the given time period.
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Arguments:
-        No arguments.
+        split: str in ["Full", "User", or "Partition"]; default: "Full".
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         Returns:
-        dict with int.
+        dict with int or list values.
         -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
         """
-        df_time_sub = self.df[(self.df["StartDate"] >= self.df["PeriodStartDate"]) & (self.df["EndDate"] <= self.df["PeriodEndDate"])]
+        states = {"n_complete":"COMPLETED", "n_cancelled":"CANCELLED", "n_failed":"FAILED", "n_timeout":"TIMEOUT"}
+
+        # Code every task by its state (-1 for other states) and count the codes in one pass
+        state_codes = self.get_state_codes(list(states.values()))[self.started_and_ended]
 
         termination_dict = {}
 
-        termination_dict["n_complete"] = (df_time_sub["State"] == "COMPLETED").sum()
-        termination_dict["n_cancelled"] = (df_time_sub["State"] == "CANCELLED").sum()
-        termination_dict["n_failed"] = (df_time_sub["State"] == "FAILED").sum()
-        termination_dict["n_timeout"] = (df_time_sub["State"] == "TIMEOUT").sum()
+        if split=="Full":
+
+            counts = np.bincount(state_codes[state_codes >= 0], minlength=len(states))
+            for i, key in enumerate(states.keys()):
+                termination_dict[key] = counts[i]
 
+        elif split=="User" or split=="Partition":
+
+            group_codes = self.get_group_codes(split)[self.started_and_ended]
+            n_groups = len(self.users) if split=="User" else len(self.partitions)
+
+            # Count (group, state) pairs at once, i.e. a crosstab of groups and states
+            # (tasks without user/partition, e.g. job steps, have group code -1 and are skipped)
+            valid = (state_codes >= 0) & (group_codes >= 0)
+            counts = np.bincount(group_codes[valid] * len(states) + state_codes[valid], minlength=n_groups*len(states))
+            counts = counts.reshape(n_groups, len(states))
+            for i, key in enumerate(states.keys()):
+                termination_dict[key] = list(counts[:,i])
+
+        else:
+            raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
         return termination_dict
 
 
+    def get_core_utilization(self) -> dict:
+        """
+        Extracts the number of CPUs the account allocated at the same time over the period
+        (see core_utilization): peak, time-weighted mean and 95th percentile, and the binned curve.
+        All tasks which start or/and end in the period are included.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        None
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        dict or None (if the timestamps of the tasks are not available).
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        period_start = np.datetime64(self.period_start_date, "s")
+        period_end = np.datetime64(self.period_end_date, "s") + np.timedelta64(1, "D")
+        return core_utilization(self.get_timestamps("Start"), self.get_timestamps("End"),
+                                self.get_metric_values("AllocCPUS"), period_start, period_end)
+
+
+    def get_prorated_cpu_time(self, split:str="Full"):
+        """
+        Extracts the CPU time (in seconds) the tasks used within the period: the run time of every task
+        is clipped to the period (see clip_to_period) and multiplied by its allocated CPUs, so tasks
+        crossing the period boundaries are counted with their share in the period.
+        All tasks which start or/and end in the period are included.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        split: str in ["Full", "User", or "Partition"]; default: "Full".
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        int for split "Full", list of int (in the order of self.users or self.partitions) otherwise.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if self._prorated_cpu_time is None:
+            period_start = np.datetime64(self.period_start_date, "s")
+            period_end = np.datetime64(self.period_end_date, "s") + np.timedelta64(1, "D")
+            starts, ends = clip_to_period(self.get_timestamps("Start"), self.get_timestamps("End"), period_start, period_end)
+            self._prorated_cpu_time = (ends - starts) * self.get_metric_values("AllocCPUS").astype(np.int64)
+
+        if split=="Full":
+            return int(self._prorated_cpu_time.sum())
+        elif split=="User" or split=="Partition":
+            n_groups = len(self.users) if split=="User" else len(self.partitions)
+            group_codes = self.get_group_codes(split)
+            valid = group_codes >= 0
+            # Integer sums are exact in float64 up to 2**53 CPU seconds
+            sums = np.bincount(group_codes[valid], weights=self._prorated_cpu_time[valid], minlength=n_groups)
+            return sums.astype(np.int64).tolist()
+        else:
+            raise NameError("Please set the 'split' argument to 'Full', 'User', or 'Partition'.")
+
 
+    def get_timestamps(self, col:str) -> np.ndarray:
+        """
+        Returns the timestamps of column "Start" or "End" of all tasks as datetime64 (NaT if unknown).
+        """
+        return self.df[col].to_numpy()
+
+
+    def get_metric_values(self, metric:str) -> np.ndarray:
+        """
+        Returns the values of a task metric (e.g. "ElapsedRaw") of all tasks.
+        """
+        return self.df[metric].to_numpy()
 
-        
 
+    def get_state_codes(self, states:list) -> np.ndarray:
+        """
+        Codes every task by the position of its state in states (-1 for other states).
+        """
+        return pd.Index(states).get_indexer(self.df["State"])
+
+
+    def get_group_codes(self, split:str) -> np.ndarray:
+        """
+        Codes every task by the position of its user or partition in self.users or self.partitions.
+        The codes are computed once per split.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        split: str in ["User", or "Partition"].
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        np.ndarray of int.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        if split not in self._group_codes:
+            split_list = self.users if split=="User" else self.partitions
+            self._group_codes[split] = pd.Categorical(self.df[split], categories=split_list).codes.astype(np.intp)
+        return self._group_codes[split]
 
 
+    def count_by_group(self, split:str, mask:np.ndarray) -> list:
+        """
+        Counts the tasks selected by mask for every user or partition in one pass.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Arguments:
+        split: str in ["User", or "Partition"].
+        mask: np.ndarray of bool; tasks to count.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        Returns:
+        list of int; counts in the order of self.users or self.partitions.
+        -- -- -- -- -- -- -- -- -- -- -- -- -- -- --
+        """
+        n_groups = len(self.users) if split=="User" else len(self.partitions)
+        group_codes = self.get_group_codes(split)[mask]
+        # Tasks without user/partition (e.g. job steps) have group code -1 and are not counted
+        return list(np.bincount(group_codes[group_codes >= 0], minlength=n_groups))
@@ -0,0 +1,23 @@
+"""
+Stand-in for sacct in the tests: prints a canned 'sacct --parsable2' output and exits.
+
+Usage:
+python fake_sacct.py <output file> [--exit-status STATUS] [--error MESSAGE]
+"""
+
+import argparse
+import sys
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print canned sacct output.")
+    parser.add_argument("output", help="file with the canned output, - for no output")
+    parser.add_argument("--exit-status", type=int, default=0)
+    parser.add_argument("--error", default=None, help="message printed to stderr")
+    args = parser.parse_args()
+
+    if args.output != "-":
+        with open(args.output, "r") as file:
+            sys.stdout.write(file.read())
+    if args.error is not None:
+        print(args.error, file=sys.stderr)
+    sys.exit(args.exit_status)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from instrumentation import RunProfile, get_peak_rss_mb, reset_peak_rss, run_step
+
+
+def allocate_mb(n_mb: int) -> float:
+    values = np.ones(n_mb * 2**20 // 8)
+    return float(values.sum())
+
+
+def test_sub_step_keeps_peak_of_enclosing_stage():
+    if not reset_peak_rss():
+        pytest.skip("the peak RSS cannot be reset on this platform")
+
+    with RunProfile() as profile:
+        with profile.stage("outer"):
+            allocate_mb(200)
+            run_step("inner", allocate_mb, 10)
+
+    peaks = {record["stage"]: record["peak_rss_mb"] for record in profile.to_dict()["stages"]}
+    # The 200 MB were freed before the sub-step, so only the enclosing stage includes them
+    assert peaks["outer"] >= peaks["outer/inner"] + 150
+
+
+def test_peak_rss_is_positive():
+    assert get_peak_rss_mb() > 0
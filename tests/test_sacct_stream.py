@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from data_loader import load_dataset
+from sacct_stream import load_sacct_stream
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SACCT_OUTPUT_PATH = os.path.join(TESTS_DIR, "data", "sacct_output.txt")
+
+
+def fake_sacct(*args) -> list:
+    return [sys.executable, os.path.join(TESTS_DIR, "fake_sacct.py"), *args]
+
+
+@pytest.mark.parametrize("account", ["acc-a", None])
+@pytest.mark.parametrize("chunksize", [3, 1000])
+def test_stream_equals_dataset_file(account, chunksize):
+    expected = load_dataset(SACCT_OUTPUT_PATH, account, "2021-01-01", "2021-01-31", chunksize=chunksize)
+    dataset = load_sacct_stream(fake_sacct(SACCT_OUTPUT_PATH), account, "2021-01-01", "2021-01-31",
+                                chunksize=chunksize)
+    assert len(dataset) > 0
+    pd.testing.assert_frame_equal(dataset, expected)
+
+
+def test_failing_command_without_output():
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        load_sacct_stream(fake_sacct("-", "--exit-status", "1", "--error", "sacct: error: Invalid user"),
+                          "acc-a", "2021-01-01", "2021-01-31")
+    assert error.value.returncode == 1
+    assert "Invalid user" in error.value.stderr
+
+
+def test_failing_command_with_output():
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        load_sacct_stream(fake_sacct(SACCT_OUTPUT_PATH, "--exit-status", "2"), "acc-a", "2021-01-01", "2021-01-31")
+    assert error.value.returncode == 2
+
+
+def test_empty_output():
+    with pytest.raises(ValueError):
+        load_sacct_stream(fake_sacct("-"), "acc-a", "2021-01-01", "2021-01-31")
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from column_store import ColumnStatsExtractor, ColumnStore, build_column_store
+from engines import get_engine
+from stats_extractor import StatsExtractor, segment_summaries
+
+ACCOUNT = "acc-a"
+PERIOD = ("2021-03-01", "2021-03-31")
+METRICS = ["AllocCPUS", "ElapsedRaw", "CPUTimeRaw"]
+
+
+def pandas_summary(values: pd.Series) -> list:
+    """
+    Task metrics of one group as computed by the pandas path before segment_summaries.
+    """
+    return [values.min(), values.quantile(.05), values.quantile(.25), values.median(),
+            values.quantile(.75), values.quantile(.95), values.max(), round(values.mean(), 3)]
+
+
+def pandas_task_metrics(df: pd.DataFrame, split: str, split_list: list) -> dict:
+    """
+    Task metrics of the tasks which started and ended in the period, with a pandas groupby per split.
+    """
+    df = df[(df["StartDate"] >= pd.to_datetime(PERIOD[0])) & (df["EndDate"] <= pd.to_datetime(PERIOD[1]))]
+    if split == "Full":
+        return {metric: pandas_summary(df[metric]) for metric in METRICS}
+    groups = df.groupby(df[split].astype(object))
+    return {metric: [pandas_summary(groups.get_group(name)[metric]) if name in groups.groups else [np.nan] * 8
+                     for name in split_list] for metric in METRICS}
+
+
+def write_dump(path: str, n_rows: int=3000, seed: int=0):
+    """
+    Writes a sacct dump with skewed users/partitions, users and partitions with a single task,
+    tasks without start or end, other accounts, and job steps without user and partition.
+    """
+    rng = np.random.default_rng(seed)
+    users = [f"user-{i}" for i in range(12)]
+    partitions = ["kepler", "fuchs", "gpu", "bigmem"]
+    start = pd.Timestamp("2021-02-20") + pd.to_timedelta(rng.integers(0, 45 * 86400, n_rows), unit="s")
+    elapsed = rng.geometric(1e-4, n_rows)
+    alloc_cpus = rng.choice([1, 1, 2, 4, 8, 16, 128], n_rows)
+    dump = pd.DataFrame({
+        "JobID": [str(i) for i in range(1, n_rows + 1)],
+        "Account": rng.choice([ACCOUNT, ACCOUNT, ACCOUNT, "acc-b"], n_rows),
+        "User": rng.choice(users, n_rows, p=np.linspace(2, 0.1, len(users)) / np.linspace(2, 0.1, len(users)).sum()),
+        "Partition": rng.choice(partitions, n_rows, p=[.6, .3, .08, .02]),
+        "Start": start.strftime("%Y-%m-%dT%H:%M:%S"),
+        "End": (start + pd.to_timedelta(elapsed, unit="s")).strftime("%Y-%m-%dT%H:%M:%S"),
+        "CPUTimeRAW": elapsed * alloc_cpus,
+        "ElapsedRaw": elapsed,
+        "AllocCPUS": alloc_cpus,
+        "State": rng.choice(["COMPLETED", "FAILED", "TIMEOUT", "CANCELLED by 1000"], n_rows, p=[.7, .1, .1, .1]),
+    })
+    dump.loc[rng.choice(n_rows, 20, replace=False), "Start"] = "Unknown"
+    dump.loc[rng.choice(n_rows, 20, replace=False), "End"] = "Unknown"
+
+    # A user and a partition with a single task in the period
+    single = dump.iloc[[0]].assign(JobID="9001", Account=ACCOUNT, User="user-single", Partition="single",
+                                   Start="2021-03-10T10:00:00", End="2021-03-10T11:00:00",
+                                   CPUTimeRAW=7200, ElapsedRaw=3600, AllocCPUS=2)
+    # Job steps (e.g. '123.batch') have no user and partition
+    steps = dump.sample(frac=0.1, random_state=seed).assign(User="", Partition="")
+    steps["JobID"] = steps["JobID"] + ".batch"
+
+    pd.concat([dump, single, steps]).to_csv(path, sep="|", index=False)
+
+
+@pytest.fixture(scope="module")
+def dump_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dump") / "sacct.csv")
+    write_dump(path)
+    return path
+
+
+@pytest.fixture(scope="module")
+def cleaned_dataset(dump_path):
+    return get_engine("pandas").load_dataset(dump_path, ACCOUNT, *PERIOD)
+
+
+def assert_task_metrics_equal(actual: dict, expected: dict):
+    for metric in METRICS:
+        np.testing.assert_array_equal(np.array(actual[metric], dtype=np.float64),
+                                      np.array(expected[metric], dtype=np.float64), err_msg=metric)
+
+
+@pytest.mark.parametrize("dtype", [np.int8, np.int32, np.int64, np.float64])
+def test_segment_summaries(dtype):
+    rng = np.random.default_rng(1)
+    values = rng.integers(0, 100, 500).astype(dtype)
+    # Group 3 is empty, group 4 has a single value, -1 (no group) is skipped
+    group_codes = rng.choice([-1, 0, 1, 2], 500, p=[.1, .6, .25, .05])
+    group_codes[7] = 4
+
+    summaries = segment_summaries(values, group_codes, 5)
+
+    for group in range(5):
+        expected = pandas_summary(pd.Series(values[group_codes == group]))
+        np.testing.assert_array_equal(np.array(summaries[group], dtype=np.float64),
+                                      np.array(expected, dtype=np.float64), err_msg=f"group {group}")
+
+
+@pytest.mark.parametrize("split", ["Full", "User", "Partition"])
+def test_pandas_task_metrics(cleaned_dataset, split):
+    stats_extractor = StatsExtractor(cleaned_dataset)
+    split_list = stats_extractor.users if split == "User" else stats_extractor.partitions
+    assert "user-single" in stats_extractor.users and "single" in stats_extractor.partitions
+    assert cleaned_dataset["User"].isna().any()
+
+    assert_task_metrics_equal(stats_extractor.get_task_metrics(split),
+                              pandas_task_metrics(cleaned_dataset, split, split_list))
+
+
+@pytest.mark.parametrize("split", ["Full", "User", "Partition"])
+def test_arrow_task_metrics(dump_path, cleaned_dataset, split):
+    pytest.importorskip("pyarrow")
+    engine = get_engine("pyarrow")
+    stats_extractor = engine.stats_extractor(engine.load_dataset(dump_path, ACCOUNT, *PERIOD))
+    split_list = stats_extractor.users if split == "User" else stats_extractor.partitions
+
+    assert_task_metrics_equal(stats_extractor.get_task_metrics(split),
+                              pandas_task_metrics(cleaned_dataset, split, split_list))
+
+
+@pytest.mark.parametrize("split", ["Full", "User", "Partition"])
+def test_column_store_task_metrics(dump_path, cleaned_dataset, split, tmp_path):
+    build_column_store(dump_path, str(tmp_path / "store"), chunksize=500)
+    stats_extractor = ColumnStatsExtractor(ColumnStore(str(tmp_path / "store")), ACCOUNT, *PERIOD)
+    split_list = stats_extractor.users if split == "User" else stats_extractor.partitions
+
+    assert_task_metrics_equal(stats_extractor.get_task_metrics(split),
+                              pandas_task_metrics(cleaned_dataset, split, split_list))